@@ -0,0 +1,225 @@
+"""
+leek.py 管理命令延迟基准测试
+
+在临时目录中搭建最小的项目结构，用 benchmarks/stubs 中的替身代替 npm、poetry 和 uvicorn（可离线运行），
+以子进程方式重复执行 help、status、install（依赖未变化）、build（输入未变化）、start 到就绪和 stop，
+输出各命令的 p50/p95（JSON）。help、status 的 p50 超过固定预算，或与基线对比超过阈值时以退出码 1 结束。
+
+用法:
+    python benchmarks/bench_commands.py [--runs N] [--output 结果.json]
+                                        [--baseline 基线.json] [--threshold 0.2] [--save-baseline 基线.json]
+                                        [--budget-ms 命令=毫秒 ...] [--no-budget]
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import venv
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).absolute().parent
+REPO_ROOT = BENCH_DIR.parent
+STUBS_DIR = BENCH_DIR / "stubs"
+# 绝对差值低于该值（秒）时不视为回退，避免毫秒级命令的抖动触发失败
+MIN_REGRESSION_DELTA = 0.01
+# 默认的固定延迟预算（毫秒）：不依赖基线，help/status 的 p50 超过预算即视为回退
+DEFAULT_BUDGETS_MS = {"help": 500, "status": 500}
+
+
+def percentile(samples: list, percent: float) -> float:
+    """最近秩法百分位数"""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, math.ceil(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def create_project(root: Path):
+    """搭建最小项目：leek.py、前端源码、后端和 leek-core 的 pyproject，以及不带 pip 的虚拟环境"""
+    shutil.copy2(REPO_ROOT / "leek.py", root / "leek.py")
+
+    frontend = root / "leek-web"
+    (frontend / "src").mkdir(parents=True)
+    (frontend / "package.json").write_text('{"name": "leek-web", "scripts": {"build": "vite build"}}\n')
+    (frontend / "index.html").write_text("<!doctype html>\n")
+    for i in range(50):
+        (frontend / "src" / f"module{i}.js").write_text(f"export const value{i} = {i};\n")
+
+    backend = root / "leek-manager"
+    (backend / "app").mkdir(parents=True)
+    (backend / "app" / "__init__.py").write_text("")
+    (backend / "app" / "main.py").write_text("app = None\n")
+    (backend / "pyproject.toml").write_text('[tool.poetry]\nname = "leek-manager"\nversion = "0.1.0"\n')
+    (backend / "poetry.lock").write_text("# stub\n")
+    venv.create(backend / ".venv", with_pip=False)
+
+    core = root / "leek-core"
+    core.mkdir()
+    (core / "pyproject.toml").write_text('[project]\nname = "leek-core"\nversion = "0.1.0"\n')
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Runner:
+    """在临时项目中执行 leek.py 命令并计时"""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.env = os.environ.copy()
+        self.env["PATH"] = f"{STUBS_DIR / 'bin'}{os.pathsep}{self.env.get('PATH', '')}"
+        self.env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(STUBS_DIR), self.env.get("PYTHONPATH")]))
+        self.env["PYTHONDONTWRITEBYTECODE"] = "1"
+
+    def run(self, *args: str, expect: str = None) -> float:
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, str(self.root / "leek.py"), *args], cwd=self.root, env=self.env,
+                                capture_output=True, text=True, timeout=120)
+        elapsed = time.perf_counter() - start
+        if result.returncode != 0 or (expect and expect not in result.stdout):
+            raise RuntimeError(f"命令失败: leek.py {' '.join(args)}\n{result.stdout[-2000:]}{result.stderr[-2000:]}")
+        return elapsed
+
+
+def run_benchmarks(runs: int, warmup: int) -> dict:
+    samples = {name: [] for name in ("help", "status", "install", "build", "start", "stop")}
+    with tempfile.TemporaryDirectory(prefix="leek-bench-") as tmp:
+        root = Path(tmp)
+        create_project(root)
+        runner = Runner(root)
+        port = str(free_port())
+        # 首次 install/build 建立指纹，之后测量的都是无变化的稳态路径
+        runner.run("install", expect="leek-manager 依赖安装完成")
+        runner.run("build", expect="构建完成")
+        try:
+            for i in range(warmup + runs):
+                timings = {
+                    "help": runner.run("help"),
+                    "install": runner.run("install", expect="依赖未变化"),
+                    "build": runner.run("build", expect="跳过构建"),
+                    "start": runner.run("start", port, "--workers", "1", expect="服务启动成功"),
+                    "status": runner.run("status", expect="服务运行中"),
+                    "stop": runner.run("stop", expect="服务已停止"),
+                }
+                if i >= warmup:
+                    for name, elapsed in timings.items():
+                        samples[name].append(elapsed)
+        finally:
+            try:
+                runner.run("stop")
+            except RuntimeError:
+                pass
+
+    return {
+        name: {
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "min": min(values),
+            "max": max(values),
+            "samples": values,
+        }
+        for name, values in samples.items()
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """返回 p50 超过基线 (1 + threshold) 倍的命令"""
+    regressions = []
+    for name, stats in results.items():
+        base = baseline.get("commands", {}).get(name)
+        if not base:
+            continue
+        limit = base["p50"] * (1 + threshold)
+        if stats["p50"] > limit and stats["p50"] - base["p50"] > MIN_REGRESSION_DELTA:
+            regressions.append((name, base["p50"], stats["p50"]))
+    return regressions
+
+
+def check_budgets(results: dict, budgets: dict) -> list:
+    """返回 p50 超过固定预算（毫秒）的命令"""
+    return [(name, budget, results[name]["p50"]) for name, budget in budgets.items()
+            if name in results and results[name]["p50"] * 1000 > budget]
+
+
+def parse_budget(value: str) -> tuple:
+    name, sep, budget = value.partition("=")
+    try:
+        if not sep:
+            raise ValueError
+        return name, float(budget)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"预算格式应为 命令=毫秒: {value}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="leek.py 管理命令延迟基准测试")
+    parser.add_argument("--runs", type=int, default=10, help="每个命令的测量次数")
+    parser.add_argument("--warmup", type=int, default=1, help="不计入结果的预热次数")
+    parser.add_argument("--output", type=Path, help="结果 JSON 输出路径")
+    parser.add_argument("--baseline", type=Path, help="对比的基线 JSON")
+    parser.add_argument("--threshold", type=float, default=0.2, help="p50 超过基线的比例阈值（默认 0.2 即 20%%）")
+    parser.add_argument("--save-baseline", type=Path, help="把本次结果保存为基线")
+    parser.add_argument("--budget-ms", type=parse_budget, action="append", default=[], metavar="命令=毫秒",
+                        help=f"命令 p50 的固定预算，可重复，覆盖默认值 {DEFAULT_BUDGETS_MS}")
+    parser.add_argument("--no-budget", action="store_true", help="不检查固定预算")
+    args = parser.parse_args()
+
+    if os.name != "posix":
+        sys.exit("基准测试依赖 POSIX 的替身脚本，仅支持 Linux/macOS")
+
+    commands = run_benchmarks(args.runs, args.warmup)
+    results = {
+        "created_at": time.time(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "runs": args.runs,
+        "commands": commands,
+    }
+
+    print(f"{'命令':<10}{'p50':>10}{'p95':>10}{'min':>10}{'max':>10}")
+    for name, stats in commands.items():
+        print(f"{name:<10}" + "".join(f"{stats[key] * 1000:>8.1f}ms" for key in ("p50", "p95", "min", "max")))
+
+    for path in filter(None, (args.output, args.save_baseline)):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(results, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        print(f"结果已保存: {path}")
+
+    failed = False
+    budgets = {} if args.no_budget else {**DEFAULT_BUDGETS_MS, **dict(args.budget_ms)}
+    if budgets:
+        over = check_budgets(commands, budgets)
+        if over:
+            print("超出固定预算（p50）:")
+            for name, budget, p50 in over:
+                print(f"  {name}: {p50 * 1000:.1f}ms > {budget:.0f}ms")
+            failed = True
+        else:
+            print("固定预算检查通过: " + ", ".join(f"{name} <= {budget:.0f}ms" for name, budget in budgets.items()))
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        regressions = compare(commands, baseline, args.threshold)
+        if regressions:
+            print(f"性能回退（p50 超过基线 {args.threshold:.0%}）:")
+            for name, old, new in regressions:
+                print(f"  {name}: {old * 1000:.1f}ms -> {new * 1000:.1f}ms")
+            failed = True
+        else:
+            print(f"未发现性能回退（阈值 {args.threshold:.0%}）")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""leek-core 替身：让 install() 的版本检查认为本地包已安装"""
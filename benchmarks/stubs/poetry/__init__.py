@@ -0,0 +1 @@
+"""poetry 替身：只实现 leek.py 用到的子命令"""
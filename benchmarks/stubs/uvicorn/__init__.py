@@ -0,0 +1,55 @@
+"""uvicorn 替身：在继承的 socket 上提供最小的 HTTP 服务"""
+import os
+import signal
+import socketserver
+import sys
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+
+class Config:
+    def __init__(self, app, workers=1, **kwargs):
+        self.app = app
+        self.workers = workers
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        pass
+
+    def server_activate(self):
+        self.socket.listen(128)
+
+
+class Server:
+    def __init__(self, config):
+        self.config = config
+
+    def run(self, sockets):
+        server = _Server(("0.0.0.0", 0), _Handler, bind_and_activate=False)
+        server.socket = sockets[0]
+        server.server_activate()
+        signal.signal(signal.SIGTERM, lambda *args: os._exit(0))
+        print("INFO:     Application startup complete.", flush=True)
+        server.serve_forever(poll_interval=0.05)
+
+
+def main():
+    """python -m uvicorn app.main:app --host H --port P（不支持继承 socket 的平台）"""
+    import socket
+    args = sys.argv[1:]
+    sock = socket.socket()
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args[args.index("--host") + 1], int(args[args.index("--port") + 1])))
+    Server(Config(args[0])).run(sockets=[sock])
@@ -0,0 +1,23 @@
+import os
+import signal
+
+
+class Multiprocess:
+    """多 worker 替身：fork 出 workers 个进程共用同一个 socket"""
+
+    def __init__(self, config, target, sockets):
+        self.config = config
+        self.target = target
+        self.sockets = sockets
+
+    def run(self):
+        pids = []
+        for _ in range(self.config.workers):
+            pid = os.fork()
+            if pid == 0:
+                self.target(sockets=self.sockets)
+                os._exit(0)
+            pids.append(pid)
+        signal.signal(signal.SIGTERM, lambda *args: [os.kill(pid, signal.SIGTERM) for pid in pids])
+        for pid in pids:
+            os.waitpid(pid, 0)
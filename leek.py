@@ -13,121 +13,1005 @@ if sys.version_info < (3, 11):
 import subprocess
 import shutil
 import time
+import json
+import hashlib
 from pathlib import Path
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from typing import Optional
+import importlib.util
+
+# 各命令依赖的第三方模块，执行命令前按需检查（find_spec 不会真正导入模块）
+COMMAND_DEPENDENCIES = {
+    "start": ("psutil", "poetry"),
+    "stop": ("psutil",),
+    "restart": ("psutil", "poetry"),
+    "status": ("psutil",),
+    "_supervise": ("psutil", "poetry"),
+    "monitor": ("psutil",),
+    "install": ("poetry",),
+    "compile": ("poetry",),
+    "vendor": ("poetry",),
+    "profile-startup": ("poetry",),
+    "run": ("poetry",),
+    "deploy": ("psutil", "poetry"),
+    "dml": ("poetry",),
+    "migrate": ("poetry",),
+    "downgrade": ("poetry",),
+    "db_status": ("poetry",),
+    "check_migration": ("poetry",),
+}
+# 脚本自身需要导入使用的模块，其余模块（poetry）只需存在于当前解释器
+IMPORTED_MODULES = ("psutil",)
+# 作用于服务实例的命令，可通过 --name 选择命名实例
+INSTANCE_COMMANDS = ("start", "stop", "restart", "status", "logs", "monitor", "deploy", "_supervise")
+psutil = None
+
+
 def ensure_module(module, package=None):
+    """模块不存在时通过 pip 安装，返回是否执行了安装"""
+    if importlib.util.find_spec(module) is not None:
+        return False
+    print(f"安装依赖: {package or module}")
+    subprocess.check_call([sys.executable, "-m", "pip", "install", package or module])
+    return True
+
+
+def require_modules(*modules):
+    """确保依赖存在并导入脚本需要直接使用的模块"""
+    installed = False
+    for module in modules:
+        installed = ensure_module(module) or installed
+    if installed:
+        importlib.invalidate_caches()
+        missing = [module for module in modules if importlib.util.find_spec(module) is None]
+        if missing and hasattr(os, "geteuid") and os.geteuid() == 0 and not os.environ.get('LEEK_RESTARTED'):
+            env = os.environ.copy()
+            env['LEEK_RESTARTED'] = '1'
+            print(f"重启进程: {sys.executable} {sys.argv}")
+            # 修复：确保第一个参数是脚本路径，而不是命令参数
+            exec_args = [sys.executable, str(Path(__file__).absolute())] + sys.argv[1:]
+            os.execve(sys.executable, exec_args, env)
+    for module in modules:
+        if module in IMPORTED_MODULES and globals().get(module) is None:
+            globals()[module] = importlib.import_module(module)
+
+
+# 预压缩静态资源：可压缩的扩展名、最小压缩大小，以及缓存策略对应的 Cache-Control
+COMPRESSIBLE_EXTENSIONS = {
+    ".js", ".mjs", ".css", ".html", ".htm", ".svg", ".json", ".map", ".txt", ".xml",
+    ".wasm", ".ico", ".ttf", ".otf", ".eot",
+}
+COMPRESS_MIN_SIZE = 1024
+ASSET_MANIFEST = "asset-manifest.json"
+CACHE_CONTROL = {
+    "immutable": "public, max-age=31536000, immutable",
+    "no-cache": "no-cache",
+}
+
+
+def _compress_asset(path: str) -> dict:
+    """为单个静态文件生成 .gz（以及可用时的 .br），只保留比原文件小的结果"""
+    with open(path, "rb") as f:
+        data = f.read()
+    result = {"gzip": None, "br": None}
+    import gzip
+    compressed = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(compressed) < len(data):
+        _replace_file(path + ".gz", compressed)
+        result["gzip"] = len(compressed)
     try:
-        __import__(module)
+        import brotli
     except ImportError:
-        print(f"安装依赖: {package or module}")
-        subprocess.check_call([sys.executable, "-m", "pip", "install", "--force-reinstall", package or module])
-        return True
-    return False
+        return result
+    compressed = brotli.compress(data, quality=11)
+    if len(compressed) < len(data):
+        _replace_file(path + ".br", compressed)
+        result["br"] = len(compressed)
+    return result
 
-installed = False
-installed = ensure_module("psutil") or installed
-installed = ensure_module("alembic") or installed
-installed = ensure_module("poetry") or installed
-if installed and hasattr(os, "geteuid") and os.geteuid() == 0 and not os.environ.get('LEEK_RESTARTED'):
-    env = os.environ.copy()
-    env['LEEK_RESTARTED'] = '1'
-    print(f"重启进程: {sys.executable} {sys.argv}")
-    # 修复：确保第一个参数是脚本路径，而不是命令参数
-    exec_args = [sys.executable, str(Path(__file__).absolute())] + sys.argv[1:]
-    os.execve(sys.executable, exec_args, env)
-    
-import psutil
-try:
-    import tomllib
-except ImportError:
-    # 对于Python 3.10及以下版本，使用tomli
-    ensure_module("tomli", "tomli")
-    import tomli as tomllib
 
-try:
-    import importlib.metadata
-except ImportError:
-    ensure_module("importlib_metadata", "importlib-metadata")
+def _replace_file(path: str, data: bytes):
+    """写临时文件后 os.replace，目标若是复用上一版本的硬链接也不会改写其 inode"""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def shell_join(args) -> str:
+    """把参数列表转换为 run_command 使用的 shell 命令字符串，按平台的 shell 规则转义空格和特殊字符"""
+    if os.name == "nt":
+        return subprocess.list2cmdline([str(arg) for arg in args])
+    import shlex
+    return shlex.join(str(arg) for arg in args)
+
+
+@dataclass
+class CommandResult:
+    """run_command 的执行结果，bool 值表示命令是否成功"""
+    command: str
+    returncode: Optional[int]
+    duration: float
+    output_bytes: int = 0
+    tail: list = field(default_factory=list)
+    timed_out: bool = False
+    error: Optional[str] = None
+
+    def __bool__(self) -> bool:
+        return self.returncode == 0 and not self.timed_out and self.error is None
+
+
+class _HashingReader:
+    """包装文件对象，读取时同步计算 sha256（打包时只读一遍文件）"""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.hash = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.hash.update(data)
+        return data
+
+
+class _PrefixedOutput:
+    """
+    按线程给输出加前缀的 stdout 包装：并行任务各自设置前缀，
+    完整的行才写出，避免多线程输出交错在同一行。任务结束时调用 close() 写出末尾不完整的行。
+    """
+
+    class _Buffer:
+        def __init__(self, owner):
+            self.owner = owner
+
+        def write(self, data: bytes):
+            # 子进程输出按块到达，多字节字符可能被切开，用每个线程各自的增量解码器拼接
+            decoder = getattr(self.owner.local, "decoder", None)
+            if decoder is None:
+                import codecs
+                decoder = self.owner.local.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            self.owner.write(decoder.decode(data))
+            return len(data)
+
+        def flush(self):
+            self.owner.flush()
+
+    def __init__(self, stream):
+        import threading
+        self.stream = stream
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.buffer = self._Buffer(self)
+
+    def set_prefix(self, prefix: str):
+        self.local.prefix = prefix
+        self.local.pending = ""
+        self.local.decoder = None
+
+    def write(self, text: str):
+        prefix = getattr(self.local, "prefix", "")
+        pending = getattr(self.local, "pending", "") + text
+        *lines, self.local.pending = pending.split("\n")
+        if lines:
+            with self.lock:
+                for line in lines:
+                    self.stream.write(f"{prefix}{line}\n")
+                self.stream.flush()
+        return len(text)
+
+    def flush(self):
+        # 完整的行在 write 中已写出；不完整的行留到 close()，避免一行被按块拆成多行
+        with self.lock:
+            self.stream.flush()
+
+    def close(self):
+        """结束当前线程的任务：写出解码器中残留的字节和末尾不完整的行"""
+        decoder = getattr(self.local, "decoder", None)
+        if decoder is not None:
+            self.local.decoder = None
+            self.write(decoder.decode(b"", final=True))
+        pending = getattr(self.local, "pending", "")
+        if pending:
+            self.local.pending = ""
+            with self.lock:
+                self.stream.write(f"{getattr(self.local, 'prefix', '')}{pending}\n")
+                self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class RotatingLogWriter:
+    """
+    服务日志写入器：从 stdin 读取服务输出写入 leek.log，按大小或时间轮转，
+    轮转出的分段在后台线程中压缩为多成员 gzip。
+    每个分段维护偏移索引 <分段>.idx，每行 "写入时间 原始偏移 [压缩偏移]"，
+    供 logs 命令按时间直接定位，无需扫描整个文件。
+    """
+    INDEX_BYTES = 64 * 1024  # 每写入 64KB 记录一条索引
+    INDEX_SECONDS = 1.0      # 或每隔 1 秒记录一条索引
+    # uvicorn 每个 worker 完成应用启动时输出的日志，用于判断新实例是否就绪
+    READY_MARKER = b"Application startup complete"
+
+    def __init__(self, path: Path, max_bytes: int = 100 * 1024 * 1024, interval: float = 24 * 3600, backups: int = 10,
+                 ready_file: Optional[Path] = None):
+        self.path = Path(path)
+        self.index_path = self.path.with_name(self.path.name + ".idx")
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.backups = backups
+        self.ready_file = Path(ready_file) if ready_file else None
+        self.ready_count = 0
+        self.ready_carry = b""
+        self.compressors = []
+        self._open()
+
+    def _open(self):
+        self.file = open(self.path, "ab", buffering=0)
+        self.index = open(self.index_path, "a", encoding="utf-8")
+        self.size = self.path.stat().st_size
+        self.opened_at = time.time()
+        self.last_index_size = self.size
+        self.last_index_time = 0.0
+        self.at_line_start = True
+        if self.index.tell() == 0:
+            # 新分段（或旧版本留下的无索引日志）从偏移 0 开始建立索引
+            self._write_index(0)
+
+    def _write_index(self, offset: int):
+        now = time.time()
+        self.index.write(f"{now:.3f} {offset}\n")
+        self.index.flush()
+        self.last_index_size = offset
+        self.last_index_time = now
+
+    def _count_ready(self, chunk: bytes):
+        """累计就绪标记出现次数并写入 ready_file（跨块边界的标记也能识别）"""
+        data = self.ready_carry + chunk
+        found = data.count(self.READY_MARKER)
+        self.ready_carry = data[-(len(self.READY_MARKER) - 1):]
+        if found:
+            self.ready_count += found
+            tmp = self.ready_file.with_name(self.ready_file.name + ".tmp")
+            tmp.write_text(str(self.ready_count), encoding="utf-8")
+            os.replace(tmp, self.ready_file)
+
+    def _reopen_if_moved(self):
+        """
+        滚动重启期间新旧实例的写入进程会短暂同时写同一个日志文件，
+        文件被另一方轮转走时重新打开，避免继续写入已轮转的分段
+        """
+        try:
+            moved = os.stat(self.path).st_ino != os.fstat(self.file.fileno()).st_ino
+        except FileNotFoundError:
+            moved = True
+        if moved:
+            self.file.close()
+            self.index.close()
+            self._open()
+
+    def write(self, chunk: bytes):
+        if self.ready_file:
+            self._count_ready(chunk)
+        self._reopen_if_moved()
+        # 以文件实际大小为准，兼容其他写入进程同时追加
+        self.size = os.fstat(self.file.fileno()).st_size
+        newline = chunk.rfind(b"\n")
+        rotate_due = self.size >= self.max_bytes or (self.interval and time.time() - self.opened_at >= self.interval)
+        if rotate_due and newline >= 0 and self.size > 0:
+            # 只在行边界轮转
+            self.file.write(chunk[:newline + 1])
+            self.size += newline + 1
+            self.rotate()
+            chunk = chunk[newline + 1:]
+            newline = chunk.rfind(b"\n")
+            if not chunk:
+                return
+        base = self.size
+        index_due = (base - self.last_index_size >= self.INDEX_BYTES
+                     or time.time() - self.last_index_time >= self.INDEX_SECONDS)
+        if index_due and self.at_line_start:
+            # 当前位置是行首：索引指向本块开头，之后的内容都写于此刻之后
+            self._write_index(base)
+            index_due = False
+        self.file.write(chunk)
+        self.size += len(chunk)
+        self.at_line_start = chunk.endswith(b"\n")
+        if index_due and newline >= 0:
+            self._write_index(base + newline + 1)
+
+    def rotate(self):
+        self.file.close()
+        self.index.close()
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        segment = self.path.with_name(f"{self.path.name}.{stamp}")
+        suffix = 1
+        while segment.exists() or segment.with_name(segment.name + ".gz").exists():
+            segment = self.path.with_name(f"{self.path.name}.{stamp}-{suffix}")
+            suffix += 1
+        os.replace(self.path, segment)
+        os.replace(self.index_path, segment.with_name(segment.name + ".idx"))
+        self._open()
+        import threading
+        thread = threading.Thread(target=self._compress, args=(segment,))
+        thread.start()
+        # 只保留仍在运行的压缩线程，长期运行时列表不会无限增长
+        self.compressors = [t for t in self.compressors if t.is_alive()]
+        self.compressors.append(thread)
+
+    def _compress(self, segment: Path):
+        """按索引块把分段压缩为多个 gzip 成员，并在索引中记录每块的压缩偏移"""
+        import gzip
+        index_path = segment.with_name(segment.name + ".idx")
+        gz_path = segment.with_name(segment.name + ".gz")
+        try:
+            entries = [line.split() for line in index_path.read_text(encoding="utf-8").splitlines() if line.strip()]
+            total = segment.stat().st_size
+            bounds = [int(e[1]) for e in entries] + [total]
+            rows = []
+            with open(segment, "rb") as src, open(gz_path.with_suffix(".gz.tmp"), "wb") as dst:
+                for (ts, offset), end in zip(entries, bounds[1:]):
+                    src.seek(int(offset))
+                    rows.append(f"{ts} {offset} {dst.tell()}")
+                    dst.write(gzip.compress(src.read(end - int(offset)), compresslevel=6, mtime=0))
+            mtime = segment.stat().st_mtime
+            os.replace(gz_path.with_suffix(".gz.tmp"), gz_path)
+            os.utime(gz_path, (mtime, mtime))
+            tmp_index = index_path.with_suffix(".idx.tmp")
+            tmp_index.write_text("\n".join(rows) + "\n", encoding="utf-8")
+            os.replace(tmp_index, index_path)
+            segment.unlink()
+        except OSError as e:
+            print(f"压缩日志分段失败: {segment}, 错误: {e}", file=sys.stderr)
+        self._prune()
+
+    def _prune(self):
+        """只保留最近 backups 个轮转分段"""
+        segments = LeekManager.log_segments(self.path)[:-1]
+        for segment, index_path in segments[:-self.backups] if self.backups else segments:
+            for path in (segment, index_path):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+
+    def pump(self, stream):
+        """持续读取 stream 直到 EOF（服务进程及其 worker 全部退出）"""
+        try:
+            for chunk in iter(lambda: stream.read1(65536), b""):
+                self.write(chunk)
+        finally:
+            self.file.close()
+            self.index.close()
+            for thread in self.compressors:
+                thread.join()
+
+
+# uvicorn 启动配置（uvicorn.Config 参数），通过 --profile 或 ENVIRONMENT 环境变量选择
+SERVER_PROFILES = {
+    # 开发：热重载（仅 run 前台运行时生效），其余使用 uvicorn 默认值
+    "dev": {"reload": True},
+    # 生产：uvloop + httptools，加大 backlog，限制并发连接数，超出时直接返回 503 而不是排队；
+    # 停止时最多等待进行中的请求 20s，保证应用的 shutdown 在 stop 的强制终止期限（默认 30s）之前执行
+    "prod": {"loop": "uvloop", "http": "httptools", "backlog": 2048, "timeout_keep_alive": 15,
+             "limit_concurrency": 1000, "timeout_graceful_shutdown": 20},
+    # 低延迟：更长的 keep-alive 减少重新建连，更低的并发上限尽早拒绝过载请求，关闭访问日志
+    "lowlatency": {"loop": "uvloop", "http": "httptools", "backlog": 4096, "timeout_keep_alive": 60,
+                   "limit_concurrency": 256, "access_log": False, "timeout_graceful_shutdown": 20},
+}
+# ENVIRONMENT 环境变量取值到 profile 的映射
+ENVIRONMENT_PROFILES = {"development": "dev", "dev": "dev", "production": "prod", "prod": "prod",
+                        "lowlatency": "lowlatency"}
+# dev 热重载时排除的路径（uvicorn 默认已排除隐藏文件和 .pyc）
+RELOAD_EXCLUDES = ("static", "node_modules", "logs", "*.log")
+
+
+def resolve_profile(profile: Optional[str] = None, default: str = "prod") -> str:
+    """确定启动配置：--profile 优先，其次 ENVIRONMENT 环境变量，都未指定时使用 default"""
+    if profile is None:
+        environment = os.environ.get("ENVIRONMENT", "").strip().lower()
+        if not environment:
+            return default
+        profile = ENVIRONMENT_PROFILES.get(environment)
+        if profile is None:
+            print(f"未识别的 ENVIRONMENT={environment}，使用 {default} 配置")
+            return default
+    if profile not in SERVER_PROFILES:
+        raise SystemExit(f"未知的 profile: {profile}（可选: {', '.join(SERVER_PROFILES)}）")
+    return profile
+
+
+def _uvicorn_settings(profile: str) -> dict:
+    """profile 对应的 uvicorn.Config 参数（不含 reload），uvloop/httptools 未安装时回退到 asyncio/h11"""
+    settings = {key: value for key, value in SERVER_PROFILES[profile].items() if key != "reload"}
+    if settings.get("loop") == "uvloop" and importlib.util.find_spec("uvloop") is None:
+        settings["loop"] = "asyncio"
+    if settings.get("http") == "httptools" and importlib.util.find_spec("httptools") is None:
+        settings["http"] = "h11"
+    return settings
+
+
+def _uvicorn_cli_args(profile: str) -> list:
+    """
+    profile 对应的 uvicorn 命令行参数（不含 reload）。
+    loop/http 保持命令行默认的 auto，uvicorn 会在已安装时选用 uvloop/httptools
+    """
+    args = []
+    for key, value in SERVER_PROFILES[profile].items():
+        if key in ("reload", "loop", "http"):
+            continue
+        option = key.replace("_", "-")
+        if value is True:
+            args.append(f"--{option}")
+        elif value is False:
+            args.append(f"--no-{option}")
+        else:
+            args += [f"--{option}", str(value)]
+    return args
+
+
+# run_command 启动的构建/安装子进程的调度优先级，避免与服务进程争抢 CPU 和磁盘 I/O
+COMMAND_NICE = 10
+COMMAND_IONICE = "be:7"
+IONICE_CLASSES = ("rt", "be", "idle")
+
+
+def parse_cpu_list(text: str) -> list:
+    """解析 CPU 亲和性：`0-3,6` 形式的 CPU 列表或 `0xf` 形式的掩码"""
+    text = text.strip().lower()
+    if text.startswith("0x"):
+        mask = int(text, 16)
+        cpus = [cpu for cpu in range(mask.bit_length()) if mask >> cpu & 1]
+    else:
+        cpus = set()
+        for part in text.split(","):
+            first, _, last = part.partition("-")
+            cpus.update(range(int(first), int(last or first) + 1))
+        cpus = sorted(cpus)
+    if not cpus or cpus[0] < 0:
+        raise ValueError(text)
+    return cpus
+
+
+def format_cpu_list(cpus: list) -> str:
+    """把 CPU 列表压缩为 `0-3,6` 形式"""
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(str(first) if first == last else f"{first}-{last}" for first, last in ranges)
+
+
+def parse_ionice(text: str) -> str:
+    """解析 ionice 设置 `CLASS[:LEVEL]`（rt、be 级别 0-7，默认 4；idle 无级别），返回规范化的字符串"""
+    io_class, _, level = text.strip().lower().partition(":")
+    if io_class not in IONICE_CLASSES:
+        raise ValueError(text)
+    if io_class == "idle":
+        return io_class
+    level = int(level or 4)
+    if not 0 <= level <= 7:
+        raise ValueError(text)
+    return f"{io_class}:{level}"
+
+
+def _psutil_nice(nice: int):
+    """nice 值对应的 psutil 参数，Windows 下映射为优先级类"""
+    if os.name != "nt":
+        return nice
+    if nice < -10:
+        return psutil.HIGH_PRIORITY_CLASS
+    if nice < 0:
+        return psutil.ABOVE_NORMAL_PRIORITY_CLASS
+    if nice == 0:
+        return psutil.NORMAL_PRIORITY_CLASS
+    return psutil.BELOW_NORMAL_PRIORITY_CLASS if nice < 15 else psutil.IDLE_PRIORITY_CLASS
+
+
+def _psutil_ionice(ionice: str) -> tuple:
+    """ionice 设置对应的 psutil Process.ionice 参数，Windows 下映射为 I/O 优先级"""
+    io_class, _, level = ionice.partition(":")
+    if os.name == "nt":
+        if io_class == "idle":
+            return (psutil.IOPRIO_VERYLOW,)
+        if io_class == "rt":
+            return (psutil.IOPRIO_HIGH,)
+        return (psutil.IOPRIO_LOW if int(level) > 4 else psutil.IOPRIO_NORMAL,)
+    if io_class == "idle":
+        return (psutil.IOPRIO_CLASS_IDLE,)
+    return ({"rt": psutil.IOPRIO_CLASS_RT, "be": psutil.IOPRIO_CLASS_BE}[io_class], int(level))
+
+
+# Linux ioprio_get 的系统调用号（按架构），用于读取当前进程的 I/O 优先级
+IOPRIO_GET_SYSCALLS = {
+    "x86_64": 252, "amd64": 252, "i386": 290, "i686": 290, "aarch64": 31, "arm64": 31, "riscv64": 31,
+    "armv7l": 315, "ppc64le": 274, "s390x": 283,
+}
+IOPRIO_CLASS_SHIFT = 13
+IOPRIO_CLASSES = {"rt": 1, "be": 2, "idle": 3}
+
+
+def _current_ioprio() -> Optional[int]:
+    """当前进程的 I/O 优先级（类别 << 13 | 级别），非 Linux 或无法读取时返回 None"""
+    import platform
+    number = IOPRIO_GET_SYSCALLS.get(platform.machine().lower()) if sys.platform.startswith("linux") else None
+    if number is None:
+        return None
+    try:
+        import ctypes
+        # IOPRIO_WHO_PROCESS = 1，who = 0 表示调用进程自身
+        value = ctypes.CDLL(None, use_errno=True).syscall(number, 1, 0)
+    except (OSError, AttributeError):
+        return None
+    return value if value >= 0 else None
+
+
+def _lowered_priority_popen(command: str) -> dict:
+    """
+    run_command 子进程的 Popen 参数：以较低的 CPU 和 I/O 优先级启动 shell（只降低不提升），
+    shell 及其派生的进程从一开始就继承该优先级，不依赖 psutil，也不在子进程中执行 Python 代码。
+    POSIX 用 nice/ionice 包装 `sh -c`，Windows 以低于正常的优先级类创建进程
+    """
+    if os.name == "nt":
+        return {"args": command, "shell": True, "creationflags": subprocess.BELOW_NORMAL_PRIORITY_CLASS}
+    prefix = []
+    nice = shutil.which("nice")
+    current_nice = os.nice(0)
+    if nice and current_nice < COMMAND_NICE:
+        prefix += [nice, "-n", str(COMMAND_NICE - current_nice)]
+    ionice = shutil.which("ionice")
+    io_class, _, level = COMMAND_IONICE.partition(":")
+    target = IOPRIO_CLASSES[io_class] << IOPRIO_CLASS_SHIFT | int(level or 0)
+    current_io = _current_ioprio()
+    # 优先级值数值越大优先级越低，已不高于目标时保持不变
+    if ionice and current_io is not None and current_io < target:
+        prefix += [ionice, "-c", str(IOPRIO_CLASSES[io_class]), "-n", level or "0"]
+    if not prefix:
+        return {"args": command, "shell": True}
+    return {"args": prefix + ["/bin/sh", "-c", command], "shell": False}
+
+
+def _serve(fd: int, workers: int, profile: str = "prod"):
+    """
+    在项目虚拟环境中运行（leek.py _serve）：用继承的 socket 启动 uvicorn。
+    新旧实例共用同一个端口，滚动重启时不会出现端口不可用的窗口。
+    """
+    import socket
+    sys.path.insert(0, os.getcwd())
+    import uvicorn
+    sock = socket.socket(fileno=fd)
+    settings = _uvicorn_settings(profile)
+    print(f"[leek] profile {profile}: {json.dumps(settings)}", flush=True)
+    config = uvicorn.Config("app.main:app", workers=workers, **settings)
+    server = uvicorn.Server(config=config)
+    if workers > 1:
+        import inspect
+        from uvicorn.supervisors import Multiprocess
+        # 按实际签名选择调用方式：旧版本需要传入 target=server.run，
+        # 新版本（如 0.54）签名为 Multiprocess(config, sockets)，worker 进程按 config 自行创建 Server
+        if "target" in inspect.signature(Multiprocess.__init__).parameters:
+            supervisor = Multiprocess(config, target=server.run, sockets=[sock])
+        else:
+            supervisor = Multiprocess(config, sockets=[sock])
+        supervisor.run()
+    else:
+        server.run(sockets=[sock])
+
+
+def _time_alembic_revisions():
+    """为 Alembic 的每次迁移注册 on_version_apply 回调，打印每个版本的耗时"""
+    from alembic.runtime.migration import MigrationContext
+
+    run_migrations = MigrationContext.run_migrations
+
+    def timed_run_migrations(self, **kw):
+        timings = []
+        mark = [time.perf_counter()]
+
+        def on_version_apply(ctx, step, heads, run_args):
+            now = time.perf_counter()
+            revision = step.up_revision
+            doc = f" {revision.doc}" if revision is not None and revision.doc else ""
+            arrow = "↑" if step.is_upgrade else "↓"
+            timings.append(now - mark[0])
+            print(f"  {arrow} {step.up_revision_id}{doc}: {(now - mark[0]) * 1000:.1f}ms", flush=True)
+            mark[0] = now
+
+        self.on_version_apply_callbacks = list(self.on_version_apply_callbacks) + [on_version_apply]
+        try:
+            return run_migrations(self, **kw)
+        finally:
+            if timings:
+                print(f"共 {len(timings)} 个版本，总耗时 {sum(timings) * 1000:.1f}ms，"
+                      f"最慢 {max(timings) * 1000:.1f}ms")
+
+    MigrationContext.run_migrations = timed_run_migrations
+
+
+def _alembic(operations: list, timing: bool = False):
+    """
+    在项目虚拟环境中运行（leek.py _alembic）：通过 Alembic 命令 API 在同一进程内依次执行多个操作，
+    多个操作只需一次解释器启动。操作格式为 name 或 name=参数：
+    upgrade=head、downgrade=-1、current、revision=说明（自动生成）、reset_connection
+    """
+    sys.path.insert(0, os.getcwd())
+    from alembic import command
+    from alembic.config import Config
+    from alembic.util import CommandError
+
+    if timing:
+        _time_alembic_revisions()
+    config = Config("alembic.ini")
+    for operation in operations:
+        name, _, arg = operation.partition("=")
+        try:
+            if name == "reset_connection":
+                try:
+                    from app.db.session import reset_connection
+                    reset_connection()
+                except Exception as e:
+                    print(f"重置连接状态失败: {e}")
+            elif name == "revision":
+                command.revision(config, message=arg or None, autogenerate=True)
+            elif name in ("upgrade", "downgrade"):
+                getattr(command, name)(config, arg)
+            elif name == "current":
+                command.current(config)
+            else:
+                raise SystemExit(f"未知的 alembic 操作: {operation}")
+        except CommandError as e:
+            # 与 alembic 命令行一致，只输出错误信息
+            raise SystemExit(f"FAILED: {e}")
+
+
+# 预编译项目源码时跳过的目录
+COMPILE_SKIP_DIRS = (".venv", "venv", "node_modules", ".git", "static", ".static-releases")
+
+
+def _compile(paths: list, workers: int = 0, site_packages: bool = True) -> bool:
+    """
+    在项目虚拟环境中运行（leek.py _compile）：多进程预编译 paths 和虚拟环境 site-packages 中的 .py 文件。
+    固定使用 TIMESTAMP 失效模式：与解释器导入时写入的字节码一致，且 compileall 能跳过未变化的文件；
+    哈希模式的字节码每次都会被 compileall 重新编译。
+    """
+    import compileall
+    import py_compile
+    import sysconfig
+    from concurrent.futures import ProcessPoolExecutor
+    from functools import partial
+
+    targets = [(Path(path), True) for path in paths]
+    if site_packages:
+        for key in ("purelib", "platlib"):
+            path = Path(sysconfig.get_paths()[key])
+            if path.is_dir() and all(path != target for target, _ in targets):
+                targets.append((path, False))
+
+    ok = True
+    with ProcessPoolExecutor(max_workers=workers or None) as pool:
+        for root, is_project in targets:
+            start_time = time.perf_counter()
+            files = []
+            for current, dirs, names in os.walk(root):
+                if is_project:
+                    dirs[:] = [name for name in dirs if name not in COMPILE_SKIP_DIRS]
+                files += [os.path.join(current, name) for name in names if name.endswith(".py")]
+            # 第三方包中的语法错误（如其他版本的模板文件）不输出
+            compile_file = partial(compileall.compile_file, quiet=1 if is_project else 2,
+                                   invalidation_mode=py_compile.PycInvalidationMode.TIMESTAMP)
+            success = all(pool.map(compile_file, files, chunksize=64))
+            print(f"预编译 {root}: {len(files)} 个文件，耗时 {time.perf_counter() - start_time:.2f}s")
+            if is_project and not success:
+                ok = False
+    return ok
+
+
+class _AvailabilityProbe:
+    """后台线程持续请求服务，统计滚动重启期间的不可用时间窗口"""
+
+    def __init__(self, port: int, health_path: str = "/", interval: float = 0.02):
+        import threading
+        self.url = f"http://127.0.0.1:{port}{health_path}"
+        self.interval = interval
+        self.probes = 0
+        self.failures = 0
+        self.unavailable = 0.0
+        self.longest = 0.0
+        self._down_since = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _check(self) -> bool:
+        import urllib.request
+        import urllib.error
+        try:
+            with urllib.request.urlopen(self.url, timeout=2) as resp:
+                return resp.status < 500
+        except urllib.error.HTTPError as e:
+            return e.code < 500
+        except (OSError, ValueError):
+            return False
+
+    def _run(self):
+        while not self._stop.is_set():
+            ok = self._check()
+            now = time.perf_counter()
+            self.probes += 1
+            if not ok:
+                self.failures += 1
+                if self._down_since is None:
+                    self._down_since = now
+            elif self._down_since is not None:
+                self._close_window(now)
+            self._stop.wait(self.interval)
+
+    def _close_window(self, now: float):
+        window = now - self._down_since
+        self.unavailable += window
+        self.longest = max(self.longest, window)
+        self._down_since = None
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        if self._down_since is not None:
+            self._close_window(time.perf_counter())
+        print(f"不可用时间窗口: {self.unavailable * 1000:.0f}ms（最长 {self.longest * 1000:.0f}ms），"
+              f"探测 {self.probes} 次，失败 {self.failures} 次")
 
 
 class LeekManager:
-    def __init__(self):
+    # POSIX 下由管理脚本绑定端口并通过继承的 fd 交给 uvicorn，支持滚动重启
+    SHARED_SOCKET = os.name == "posix"
+    # 前端构建输入：目录递归参与哈希，文件按 glob 匹配 leek-web 顶层
+    FRONTEND_INPUT_DIRS = ("src", "public")
+    FRONTEND_INPUT_FILES = (
+        "index.html", "package.json", "package-lock.json", "yarn.lock", "pnpm-lock.yaml",
+        "vite.config.*", "tsconfig*.json", "*.config.js", "*.config.cjs", "*.config.mjs", "*.config.ts", ".env*",
+    )
+
+    # 按实例区分的状态文件，命名实例的位于 .leek/run/<实例名>/ 下
+    INSTANCE_STATES = ("service", "supervisor")
+
+    def __init__(self, name: Optional[str] = None):
         self.project_root = Path(__file__).parent
         self.frontend_dir = self.project_root / "leek-web"
         self.backend_dir = self.project_root / "leek-manager"
         self.core_dir = self.project_root / "leek-core"
-        self.pid_file = self.project_root / "leek.pid"
+        # 管理脚本自身的状态文件（安装指纹等），不随 clean 删除
+        self.state_dir = self.project_root / ".leek"
+        # 离线安装缓存（wheelhouse、npm 缓存），位于 .leek 下，clean 不会删除
+        self.vendor_dir = self.state_dir / "vendor"
+        # 服务实例：默认实例使用项目根目录的 leek.pid/leek.log，
+        # 命名实例（--name）的 PID、日志和状态文件都在 .leek/run/<实例名>/ 下
+        self.name = name
+        self.run_dir = self.state_dir / "run"
+        if name:
+            self.instance_dir = self.run_dir / name
+            self.pid_file = self.instance_dir / "leek.pid"
+            self.log_file = self.instance_dir / "leek.log"
+        else:
+            self.instance_dir = self.state_dir
+            self.pid_file = self.project_root / "leek.pid"
+            self.log_file = self.project_root / "leek.log"
+        # poetry 虚拟环境解释器路径（见 venv_python）
+        self._venv_python = None
         
-    def run_command(self, command: str, cwd: Optional[Path] = None, capture_output: bool = True, env: Optional[dict] = None, timeout: int = 300) -> bool:
-        """运行命令并返回结果"""
+    def run_command(self, command: str, cwd: Optional[Path] = None, capture_output: bool = True, env: Optional[dict] = None,
+                    timeout: int = 300, log_file: Optional[Path] = None, echo: bool = True, tail_lines: int = 50) -> "CommandResult":
+        """
+        运行命令并返回 CommandResult（可直接当作 bool 判断是否成功）
+        capture_output 模式下按块转发子进程输出，可同时写入 log_file，
+        保留最后 tail_lines 行用于失败时展示；timeout 为无输出超时（秒），由 select 保证即使子进程阻塞也能触发。
+        子进程以较低的 CPU 和 I/O 优先级运行（COMMAND_NICE、COMMAND_IONICE），避免构建和安装影响运行中的服务。
+        """
         print(f"执行命令: {command}")
         if cwd:
             print(f"工作目录: {cwd}")
         
+        start_time = time.perf_counter()
         try:
             if capture_output:
-                # 实时输出模式
-                process = subprocess.Popen(
-                    command,
-                    shell=True,
-                    cwd=cwd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    text=True,
-                    bufsize=1,
-                    universal_newlines=True,
-                    env=env
-                )
-                
-                import time
-                start_time = time.time()
-                last_output_time = start_time
-                while True:
-                    # 检查超时（无输出超时）
-                    current_time = time.time()
-                    if current_time - last_output_time > timeout:
-                        print(f"命令执行超时（{timeout}秒无输出），强制终止...")
-                        process.terminate()
-                        try:
-                            process.wait(timeout=10)
-                        except subprocess.TimeoutExpired:
-                            process.kill()
-                        return False
-                    
-                    output = process.stdout.readline()
-                    if output == '' and process.poll() is not None:
-                        break
-                    if output:
-                        output = output.strip()
-                        last_output_time = current_time  # 重置超时计时器
-                        if "finished with status 'error'" in output:
-                            print(output)
-                            print("请检查依赖包是否安装成功")
-                            return False
-                        print(output)
-                
-                returncode = process.poll()
-                return returncode == 0
+                result = self._pump_command(command, cwd, env, timeout, log_file, echo, tail_lines)
             else:
                 # 非捕获模式，直接执行
-                result = subprocess.run(
-                    command,
-                    shell=True,
+                process = subprocess.Popen(
+                    **_lowered_priority_popen(command),
                     cwd=cwd,
                     text=True,
                     env=env
                 )
-                return result.returncode == 0
-                
+                result = CommandResult(command, process.wait(), time.perf_counter() - start_time)
         except Exception as e:
             print(f"命令执行异常: {e}")
-            return False
-    
+            return CommandResult(command, None, time.perf_counter() - start_time, error=str(e))
+        
+        if result.timed_out:
+            print(f"命令执行超时（{timeout}秒无输出），已强制终止")
+        if capture_output:
+            print(f"命令结束: 退出码 {result.returncode}, 耗时 {result.duration:.1f}s, 输出 {result.output_bytes} 字节")
+        if not result and not echo and result.tail:
+            print(f"命令失败，最后 {len(result.tail)} 行输出:")
+            for line in result.tail:
+                print(f"  {line}")
+        return result
+
+    @staticmethod
+    def _pump_command(command: str, cwd: Optional[Path], env: Optional[dict], timeout: int,
+                      log_file: Optional[Path], echo: bool, tail_lines: int) -> "CommandResult":
+        """启动子进程并以非阻塞方式按块转发输出"""
+        import selectors
+        from collections import deque
+
+        start_time = time.perf_counter()
+        process = subprocess.Popen(
+            **_lowered_priority_popen(command),
+            cwd=cwd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            bufsize=0,
+            env=env
+        )
+        tail = deque(maxlen=tail_lines)
+        partial = b""
+        output_bytes = 0
+        timed_out = False
+        error = None
+        # 之后直接写 buffer，先把文本层中已缓冲的输出（如 "执行命令: ..."）刷出，保证顺序
+        sys.stdout.flush()
+        out = sys.stdout.buffer
+        log = open(log_file, "ab") if log_file else None
+
+        # Windows 的管道不支持 select，改用读线程 + 队列
+        if os.name == "nt":
+            import queue
+            import threading
+            chunks = queue.Queue()
+
+            def reader():
+                for chunk in iter(lambda: process.stdout.read1(65536), b""):
+                    chunks.put(chunk)
+                chunks.put(b"")
+            threading.Thread(target=reader, daemon=True).start()
+
+            def read_chunk(wait: float) -> Optional[bytes]:
+                try:
+                    return chunks.get(timeout=wait)
+                except queue.Empty:
+                    return None
+        else:
+            selector = selectors.DefaultSelector()
+            selector.register(process.stdout, selectors.EVENT_READ)
+
+            def read_chunk(wait: float) -> Optional[bytes]:
+                if not selector.select(timeout=wait):
+                    return None
+                return os.read(process.stdout.fileno(), 65536)
+
+        try:
+            last_output_time = time.perf_counter()
+            while True:
+                remaining = timeout - (time.perf_counter() - last_output_time)
+                if remaining <= 0:
+                    timed_out = True
+                    break
+                chunk = read_chunk(min(remaining, 1.0))
+                if chunk is None:
+                    continue
+                if chunk == b"":
+                    break
+                last_output_time = time.perf_counter()
+                output_bytes += len(chunk)
+                if echo:
+                    out.write(chunk)
+                    out.flush()
+                if log:
+                    log.write(chunk)
+                lines = (partial + chunk).split(b"\n")
+                partial = lines.pop()
+                for line in lines:
+                    text = line.decode("utf-8", errors="replace").rstrip("\r")
+                    tail.append(text)
+                    if "finished with status 'error'" in text:
+                        error = "请检查依赖包是否安装成功"
+                if error:
+                    print(error)
+                    break
+        finally:
+            if log:
+                log.close()
+            if timed_out or error:
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+            if os.name != "nt":
+                selector.close()
+        if partial:
+            tail.append(partial.decode("utf-8", errors="replace"))
+            if echo:
+                # 输出末尾没有换行时补上，之后的提示从新的一行开始
+                out.write(b"\n")
+                out.flush()
+        returncode = process.wait()
+        return CommandResult(command, returncode, time.perf_counter() - start_time, output_bytes,
+                             list(tail), timed_out=timed_out, error=error)
+
+    @staticmethod
+    def _file_digest(path: Path) -> Optional[str]:
+        """计算文件的 sha256，文件不存在时返回 None"""
+        if not path.is_file():
+            return None
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def _state_file(self, name: str) -> Path:
+        directory = self.instance_dir if name in self.INSTANCE_STATES else self.state_dir
+        return directory / f"{name}.json"
+
+    def _read_state(self, name: str) -> Optional[dict]:
+        """读取 .leek 下的状态文件（服务和守护进程状态按实例区分）"""
+        state_file = self._state_file(name)
+        try:
+            with open(state_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_state(self, name: str, data: dict):
+        """原子写入 .leek 下的状态文件"""
+        state_file = self._state_file(name)
+        state_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = state_file.with_suffix(".json.tmp")
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(tmp_file, state_file)
+
+    def _frontend_inputs_digest(self) -> str:
+        """对前端构建输入（源码树、package.json、锁文件、构建配置）计算内容哈希"""
+        paths = set()
+        for pattern in self.FRONTEND_INPUT_FILES:
+            paths.update(p for p in self.frontend_dir.glob(pattern) if p.is_file())
+        for dir_name in self.FRONTEND_INPUT_DIRS:
+            input_dir = self.frontend_dir / dir_name
+            if input_dir.is_dir():
+                paths.update(p for p in input_dir.rglob("*") if p.is_file())
+        h = hashlib.sha256()
+        for path in sorted(paths):
+            h.update(path.relative_to(self.frontend_dir).as_posix().encode())
+            h.update(b"\0")
+            h.update((self._file_digest(path) or "").encode())
+            h.update(b"\n")
+        return h.hexdigest()
+
+    def frontend_build_state(self) -> str:
+        """前端静态资源状态: missing（未构建）、stale（源码已变化）、current（最新）"""
+        if not (self.backend_dir / "static" / "index.html").exists():
+            return "missing"
+        manifest = self._read_state("build")
+        if not manifest or manifest.get("inputs") != self._frontend_inputs_digest():
+            return "stale"
+        return "current"
+
     def _remove(self, path: Path, name: str=None):
-        if not path.exists():
+        if not path.exists() and not path.is_symlink():
             return True
         try:
-            if path.is_dir():
+            if path.is_symlink():
+                path.unlink()
+                print(f"清理{name or '链接'}: {path} 成功")
+            elif path.is_dir():
                 shutil.rmtree(path)
                 print(f"清理{name or '目录'}: {path} 成功")
             else:
@@ -144,166 +1028,427 @@ class LeekManager:
             path_obj = Path(path)
             self._remove(path_obj, name)
 
-    def clean(self):
+    # 遍历时不进入的目录：版本库、依赖、虚拟环境以及脚本自身的状态目录
+    CLEAN_PRUNE_DIRS = {".git", "node_modules", ".venv", "venv", ".leek", ".static-releases"}
+    # 按名称匹配的目录规则和按后缀匹配的文件规则
+    CLEAN_DIR_RULES = {"__pycache__": "Python缓存"}
+    CLEAN_FILE_RULES = (
+        ((".pyc", ".pyo"), "Python字节码"),
+        ((".lock",), "锁文件"),
+    )
+
+    def _scan_clean_targets(self, roots: list, file_rules: tuple, targets: dict):
+        """
+        使用 os.scandir 单次遍历 roots，在一次遍历中匹配所有目录和文件规则，
+        匹配到的目录不再深入，CLEAN_PRUNE_DIRS 中的目录直接剪枝。结果写入 targets（路径 -> 规则名）。
+        """
+        stack = [Path(root) for root in roots if Path(root).is_dir()]
+        while stack:
+            current = stack.pop()
+            try:
+                entries = list(os.scandir(current))
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    continue
+                if is_dir:
+                    if entry.name in self.CLEAN_DIR_RULES:
+                        targets.setdefault(Path(entry.path), self.CLEAN_DIR_RULES[entry.name])
+                    elif entry.name not in self.CLEAN_PRUNE_DIRS:
+                        stack.append(Path(entry.path))
+                    continue
+                for suffixes, name in file_rules:
+                    if entry.name.endswith(suffixes):
+                        targets.setdefault(Path(entry.path), name)
+                        break
+
+    @staticmethod
+    def _path_usage(path: Path) -> tuple:
+        """统计路径下的文件数和字节数（不跟随符号链接）"""
+        try:
+            if path.is_symlink() or not path.is_dir():
+                return 1, path.lstat().st_size
+        except OSError:
+            return 0, 0
+        files, size = 0, 0
+        stack = [path]
+        while stack:
+            try:
+                entries = list(os.scandir(stack.pop()))
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(Path(entry.path))
+                    else:
+                        files += 1
+                        size += entry.stat(follow_symlinks=False).st_size
+                except OSError:
+                    continue
+        return files, size
+
+    def _run_clean(self, targets: dict, dry_run: bool = False, workers: int = 8):
+        """在线程池中删除（或 dry-run 统计）目标路径，并按规则汇总"""
+        from concurrent.futures import ThreadPoolExecutor
+
+        targets = {path: name for path, name in targets.items() if path.exists() or path.is_symlink()}
+        # 祖先目录已是目标的路径（如 build/ 下的 __pycache__）随祖先一起删除，
+        # 单独保留会在线程池中与祖先的删除竞争，dry-run 时也会被重复统计
+        roots = set(targets)
+        targets = {path: name for path, name in targets.items() if not any(parent in roots for parent in path.parents)}
+        summary = {}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            if dry_run:
+                for (path, name), (files, size) in zip(targets.items(), pool.map(self._path_usage, targets)):
+                    stat = summary.setdefault(name, [0, 0, 0])
+                    stat[0] += 1
+                    stat[1] += files
+                    stat[2] += size
+            else:
+                for (path, name), ok in zip(targets.items(), pool.map(lambda item: self._remove(*item), targets.items())):
+                    stat = summary.setdefault(name, [0, 0, 0])
+                    stat[0 if ok else 1] += 1
+
+        if dry_run:
+            print("预计清理（dry-run，未删除任何文件）:")
+            for name, (paths, files, size) in sorted(summary.items(), key=lambda item: -item[1][2]):
+                print(f"  {name}: {paths} 个路径, {files} 个文件, {size / 1024 / 1024:.2f}MB")
+            print(f"  合计: {sum(v[1] for v in summary.values())} 个文件, "
+                  f"{sum(v[2] for v in summary.values()) / 1024 / 1024:.2f}MB")
+        else:
+            for name, (ok, failed, _) in summary.items():
+                print(f"  {name}: 清理 {ok} 个" + (f", 失败 {failed} 个" if failed else ""))
+        return summary
+
+    def clean(self, dry_run: bool = False):
         print("开始清理构建输出...")
-        
-        # 清理前端构建文件
-        self._remove(self.frontend_dir / "dist", "前端构建目录")
-        
-        # 清理前端node_modules
-        self._remove(self.frontend_dir / "node_modules", "前端依赖")
-        
-        # 清理后端静态文件（复制的前端文件）
-        self._remove(self.backend_dir / "static", "后端静态文件")
-        
-        # 清理Python缓存文件
-        for root, dirs, files in os.walk(self.project_root):
-            # 清理 __pycache__ 目录
-            for dir_name in dirs[:]:  # 使用切片创建副本，避免修改迭代中的列表
-                if dir_name == "__pycache__":
-                    cache_dir = Path(root) / dir_name
-                    self._remove(cache_dir, "Python缓存")
-                    dirs.remove(dir_name)  # 从dirs中移除，避免继续遍历
-            
-            # 清理 .pyc 文件
-            for file_name in files:
-                if file_name.endswith('.pyc') or file_name.endswith('.pyo'):
-                    pyc_file = Path(root) / file_name
-                    self._remove(pyc_file, "Python字节码")
-            for file_name in files:
-                if file_name.endswith('.lock'):
-                    lock_file = Path(root) / file_name
-                    self._remove(lock_file, "锁文件")
-        
-        # 清理其他构建文件
-        build_dirs = [
-            self.backend_dir / "build",
-            self.backend_dir / "dist",
-        ]
-        
-        for build_dir in build_dirs:
-            self._remove(build_dir, "构建文件")
-        
-        # 清理 egg-info 文件（使用通配符）
-        egg_info_pattern = str(self.backend_dir / "*.egg-info")
         import glob
-        for path in glob.glob(egg_info_pattern):
-            path_obj = Path(path)
-            self._remove(path_obj, "egg-info 文件")
-        
-        # 清理PID文件
-        self._remove(self.pid_file, "PID文件")
         
-        # 清理日志文件
-        specific_logs = [
-            self.backend_dir / "leek.log",
-            self.project_root / "leek.log",
-        ]
+        targets = {}
+        # 前端构建文件、依赖，后端静态文件（复制的前端文件）
+        targets[self.frontend_dir / "dist"] = "前端构建目录"
+        targets[self.frontend_dir / "node_modules"] = "前端依赖"
+        targets[self.backend_dir / "static"] = "后端静态文件"
+        targets[self.backend_dir / ".static-releases"] = "后端静态文件版本"
         
-        for log_file in specific_logs:
-            self._remove(log_file, "日志文件")
+        # 其他构建文件、egg-info
+        targets[self.backend_dir / "build"] = "构建文件"
+        targets[self.backend_dir / "dist"] = "构建文件"
+        for path in glob.glob(str(self.backend_dir / "*.egg-info")):
+            targets[Path(path)] = "egg-info 文件"
         
-        # 清理所有 .log 文件（使用通配符）
-        log_patterns = [
-            str(self.backend_dir / "*.log"),
-            str(self.project_root / "*.log")
-        ]
+        # PID文件
+        targets[self.pid_file] = "PID文件"
         
-        import glob
-        for pattern in log_patterns:
-            for path in glob.glob(pattern):
-                path_obj = Path(path)
-                if path_obj.exists() and path_obj.is_file():
-                    self._remove(path_obj, "日志文件")
-        
-        # 清理奇怪的文件（如 =1.0.0）
-        strange_patterns = [
-            str(self.core_dir / "=*"),
-            str(self.backend_dir / "=*")
-        ]
+        # 日志文件
+        for pattern in (self.backend_dir / "*.log", self.project_root / "*.log", self.project_root / "leek.log.*"):
+            for path in glob.glob(str(pattern)):
+                if Path(path).is_file():
+                    targets[Path(path)] = "日志文件"
         
-        import glob
-        for pattern in strange_patterns:
-            for path in glob.glob(pattern):
-                path_obj = Path(path)
-                if path_obj.exists() and path_obj.is_file():
-                    self._remove(path_obj, "奇怪文件")
-        
-        # 清理 Poetry 锁文件（可选）
-        poetry_lock_files = [
-            self.core_dir / "poetry.lock",
-            self.backend_dir / "poetry.lock"
-        ]
+        # 奇怪的文件（如 =1.0.0）
+        for pattern in (self.core_dir / "=*", self.backend_dir / "=*"):
+            for path in glob.glob(str(pattern)):
+                if Path(path).is_file():
+                    targets[Path(path)] = "奇怪文件"
         
-        for lock_file in poetry_lock_files:
-            self._remove(lock_file, "Poetry 锁文件")
+        # Poetry 锁文件、前端 package-lock.json 文件
+        targets[self.core_dir / "poetry.lock"] = "Poetry 锁文件"
+        targets[self.backend_dir / "poetry.lock"] = "Poetry 锁文件"
+        targets[self.frontend_dir / "package-lock.json"] = "前端 package-lock.json 文件"
         
-        # 清理前端 package-lock.json 文件
-        self._remove(self.frontend_dir / "package-lock.json", "前端 package-lock.json 文件")
+        # Python缓存、字节码和锁文件：单次遍历整个项目
+        self._scan_clean_targets([self.project_root], self.CLEAN_FILE_RULES, targets)
         
-        print("清理完成!")
+        self._run_clean(targets, dry_run=dry_run)
+        print("清理完成!" if not dry_run else "dry-run 完成!")
     
-    def cleanpy(self):
-        """清理 core 和 manager 目录的 Python 缓存和构建文件"""
+    @staticmethod
+    def _stale_bytecode(cache_dir: Path) -> list:
+        """
+        __pycache__ 中过期的字节码：源文件已删除，或记录的源文件修改时间/大小（哈希模式为源码哈希）与当前源文件不一致。
+        其他 Python 版本生成的哈希模式字节码无法校验，只检查源文件是否存在。
+        """
+        import importlib.util
+        stale = []
+        try:
+            entries = list(os.scandir(cache_dir))
+        except OSError:
+            return stale
+        for entry in entries:
+            if not entry.name.endswith((".pyc", ".pyo")):
+                continue
+            source = cache_dir.parent / (entry.name.split(".", 1)[0] + ".py")
+            try:
+                with open(entry.path, "rb") as f:
+                    header = f.read(16)
+                source_stat = source.stat()
+            except OSError:
+                stale.append(Path(entry.path))
+                continue
+            if len(header) < 16:
+                stale.append(Path(entry.path))
+                continue
+            flags = int.from_bytes(header[4:8], "little")
+            if flags & 0b1:
+                if header[:4] == importlib.util.MAGIC_NUMBER and \
+                        importlib.util.source_hash(source.read_bytes()) != header[8:16]:
+                    stale.append(Path(entry.path))
+            elif int.from_bytes(header[8:12], "little") != int(source_stat.st_mtime) & 0xFFFFFFFF or \
+                    int.from_bytes(header[12:16], "little") != source_stat.st_size & 0xFFFFFFFF:
+                stale.append(Path(entry.path))
+        return stale
+
+    def compile(self, site_packages: bool = True, workers: int = 0) -> bool:
+        """
+        用虚拟环境的解释器并行预编译 leek-core、leek-manager（以及 site-packages）的字节码，
+        服务冷启动时不必在服务进程中编译模块；workers 为 0 时使用全部 CPU 核
+        """
+        print("预编译 Python 字节码...")
+        if not self.venv_python():
+            print("虚拟环境不存在，跳过预编译（请先执行 install）")
+            return False
+        paths = [str(path) for path in (self.core_dir, self.backend_dir) if path.exists()]
+        args = self._venv_command(str(Path(__file__).absolute()), "_compile", *paths, "--workers", str(workers))
+        if not site_packages:
+            args.append("--no-site-packages")
+        result = self.run_command(shell_join(args), cwd=self.backend_dir)
+        if result:
+            print(f"字节码预编译完成，耗时 {result.duration:.1f}s")
+        else:
+            print("字节码预编译失败!")
+        return bool(result)
+
+    # 发布包内容（与发布流程一致）、额外排除的构建输出，以及虽匹配清理规则但需要随发布包提供的依赖锁文件
+    PACKAGE_CONTENTS = ("leek-core", "leek-web", "leek-manager", "leek.py", "LICENSE", "README.md")
+    PACKAGE_EXCLUDE = {"leek-web/dist", "leek-core/build", "leek-core/dist", "leek-manager/build", "leek-manager/dist"}
+    # 依赖锁文件是构建输入（见 FRONTEND_INPUT_FILES），不受 clean 的 .lock 规则影响
+    PACKAGE_KEEP_FILES = {"poetry.lock", "package-lock.json", "yarn.lock", "pnpm-lock.yaml"}
+
+    def _package_excluded(self, arcname: str, name: str, is_dir: bool) -> bool:
+        """发布包排除规则：复用 clean 的目录/文件规则，另外排除 .git 文件（子模块）、日志和 egg-info"""
+        if arcname in self.PACKAGE_EXCLUDE or name == ".git" or name.startswith("="):
+            return True
+        if is_dir:
+            return name in self.CLEAN_PRUNE_DIRS or name in self.CLEAN_DIR_RULES or name.endswith(".egg-info")
+        if name in self.PACKAGE_KEEP_FILES:
+            return False
+        return name.endswith(".log") or any(name.endswith(suffixes) for suffixes, _ in self.CLEAN_FILE_RULES)
+
+    def _package_entries(self) -> list:
+        """
+        按归档路径排序的 (归档路径, 文件路径, 是否目录) 列表。
+        指向项目内目录的符号链接（如 leek-manager/static -> .static-releases/<版本>）按实际内容打包。
+        """
+        entries = []
+        stack = []
+        for name in self.PACKAGE_CONTENTS:
+            path = self.project_root / name
+            if not path.exists():
+                print(f"不存在，跳过: {path}")
+                continue
+            if path.is_dir():
+                entries.append((name, path, True))
+                stack.append((name, path))
+            else:
+                entries.append((name, path, False))
+        root = self.project_root.resolve()
+        while stack:
+            arcdir, current = stack.pop()
+            try:
+                children = list(os.scandir(current))
+            except OSError as e:
+                print(f"读取目录失败: {current}, 错误: {e}")
+                continue
+            for entry in children:
+                arcname = f"{arcdir}/{entry.name}"
+                path = Path(entry.path)
+                try:
+                    if entry.is_symlink():
+                        target = path.resolve()
+                        if not target.exists() or not target.is_relative_to(root):
+                            print(f"跳过项目外或失效的符号链接: {arcname}")
+                            continue
+                    is_dir = entry.is_dir()
+                except OSError:
+                    continue
+                if self._package_excluded(arcname, entry.name, is_dir):
+                    continue
+                entries.append((arcname, path, is_dir))
+                if is_dir:
+                    stack.append((arcname, path))
+        entries.sort(key=lambda item: item[0])
+        return entries
+
+    def _source_date_epoch(self) -> int:
+        """打包使用的统一修改时间：SOURCE_DATE_EPOCH，其次是最后一次提交的时间"""
+        if os.environ.get("SOURCE_DATE_EPOCH", "").isdigit():
+            return int(os.environ["SOURCE_DATE_EPOCH"])
+        try:
+            result = subprocess.run(["git", "log", "-1", "--format=%ct"], cwd=self.project_root,
+                                    capture_output=True, text=True, timeout=10)
+            if result.returncode == 0 and result.stdout.strip().isdigit():
+                return int(result.stdout.strip())
+        except (OSError, subprocess.SubprocessError):
+            pass
+        return 0
+
+    def _release_name(self) -> str:
+        """默认版本名：git describe 结果，不可用时为 dev"""
+        try:
+            result = subprocess.run(["git", "describe", "--tags", "--always"], cwd=self.project_root,
+                                    capture_output=True, text=True, timeout=10)
+            if result.returncode == 0 and result.stdout.strip():
+                return result.stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            pass
+        return "dev"
+
+    def package(self, name: Optional[str] = None, compression: str = "auto", level: Optional[int] = None,
+                output_dir: Optional[Path] = None) -> Optional[Path]:
+        """
+        生成可复现的发布包 leek_<name>.tar.zst（或 .tar.gz）：
+        条目按路径排序，修改时间统一为 SOURCE_DATE_EPOCH，属主清空、权限规范化为 644/755，排除规则与 clean 一致；
+        compression 为 auto 时优先使用多线程 zstd（zstandard 模块或 zstd 命令），否则回退到 gzip。
+        同时写入 <发布包>.sha256 和记录每个文件 sha256 的 <发布包>.manifest.json，部署时可据此校验并跳过未变化的文件。
+        """
+        import tarfile
+        import gzip
+
+        if compression == "auto":
+            try:
+                import zstandard  # noqa: F401
+                compression = "zstd"
+            except ImportError:
+                compression = "zstd" if shutil.which("zstd") else "gzip"
+        if compression not in ("zstd", "gzip"):
+            print(f"不支持的压缩格式: {compression}")
+            return None
+        name = name or self._release_name()
+        output_dir = Path(output_dir) if output_dir else self.project_root
+        output_dir.mkdir(parents=True, exist_ok=True)
+        artifact = output_dir / f"leek_{name}.tar.{'zst' if compression == 'zstd' else 'gz'}"
+        mtime = self._source_date_epoch()
+        print(f"打包 {artifact.name}（{compression}，文件修改时间 {mtime}）...")
+
+        start_time = time.perf_counter()
+        entries = self._package_entries()
+        tmp = artifact.with_name(artifact.name + ".tmp")
+        raw = open(tmp, "wb")
+        process = None
+        if compression == "gzip":
+            # 文件名和时间戳置空，保证相同输入得到相同输出
+            stream = gzip.GzipFile(filename="", mode="wb", fileobj=raw, mtime=0, compresslevel=level or 6)
+        else:
+            try:
+                import zstandard
+                stream = zstandard.ZstdCompressor(level=level or 10, threads=-1).stream_writer(raw)
+            except ImportError:
+                process = subprocess.Popen(["zstd", "-q", "-T0", f"-{level or 10}", "-c"], stdin=subprocess.PIPE, stdout=raw)
+                stream = process.stdin
+
+        files = {}
+        total_size = 0
+        try:
+            with tarfile.open(fileobj=stream, mode="w|", format=tarfile.GNU_FORMAT) as tar:
+                for arcname, path, is_dir in entries:
+                    info = tarfile.TarInfo(arcname)
+                    info.mtime = mtime
+                    info.uid = info.gid = 0
+                    info.uname = info.gname = ""
+                    if is_dir:
+                        info.type = tarfile.DIRTYPE
+                        info.mode = 0o755
+                        tar.addfile(info)
+                        continue
+                    stat = path.stat()
+                    info.size = stat.st_size
+                    info.mode = 0o755 if stat.st_mode & 0o111 else 0o644
+                    with open(path, "rb") as f:
+                        reader = _HashingReader(f)
+                        tar.addfile(info, reader)
+                    files[arcname] = {"sha256": reader.hash.hexdigest(), "size": info.size, "mode": oct(info.mode)}
+                    total_size += info.size
+            stream.close()
+            if process is not None:
+                if process.wait() != 0:
+                    raise OSError(f"zstd 退出码 {process.returncode}")
+        except (OSError, tarfile.TarError) as e:
+            print(f"打包失败: {e}")
+            raw.close()
+            tmp.unlink(missing_ok=True)
+            return None
+        raw.close()
+        os.replace(tmp, artifact)
+
+        digest = self._file_digest(artifact)
+        size = artifact.stat().st_size
+        manifest = {
+            "artifact": artifact.name,
+            "sha256": digest,
+            "size": size,
+            "compression": compression,
+            "source_date_epoch": mtime,
+            "files": files,
+        }
+        manifest_file = artifact.with_name(artifact.name + ".manifest.json")
+        manifest_file.write_text(json.dumps(manifest, ensure_ascii=False, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        artifact.with_name(artifact.name + ".sha256").write_text(f"{digest}  {artifact.name}\n", encoding="utf-8")
+
+        elapsed = time.perf_counter() - start_time
+        print(f"打包完成: {artifact}")
+        print(f"  {len(files)} 个文件，原始 {total_size / 1024 / 1024:.2f}MB，压缩后 {size / 1024 / 1024:.2f}MB"
+              f"（{size / max(total_size, 1):.1%}），耗时 {elapsed:.1f}s")
+        print(f"  sha256: {digest}")
+        print(f"  清单: {manifest_file}")
+        return artifact
+
+    def cleanpy(self, dry_run: bool = False, stale_only: bool = False):
+        """清理 core 和 manager 目录的 Python 缓存和构建文件；stale_only 时字节码只清理过期的部分"""
         print("开始清理 Python 缓存和构建文件...")
+        import glob
         
         # 只清理 core 和 manager 目录
-        target_dirs = [self.core_dir, self.backend_dir]
-        
-        for target_dir in target_dirs:
+        target_dirs = []
+        for target_dir in (self.core_dir, self.backend_dir):
             if not target_dir.exists():
                 print(f"目录不存在，跳过: {target_dir}")
                 continue
-                
-            print(f"清理目录: {target_dir}")
-            
-            # 清理 Python 缓存文件
-            for root, dirs, files in os.walk(target_dir):
-                # 清理 __pycache__ 目录
-                for dir_name in dirs[:]:  # 使用切片创建副本，避免修改迭代中的列表
-                    if dir_name == "__pycache__":
-                        cache_dir = Path(root) / dir_name
-                        self._remove(cache_dir, "Python缓存")
-                        dirs.remove(dir_name)  # 从dirs中移除，避免继续遍历
-                
-                # 清理 .pyc 文件
-                for file_name in files:
-                    if file_name.endswith('.pyc') or file_name.endswith('.pyo'):
-                        pyc_file = Path(root) / file_name
-                        self._remove(pyc_file, "Python字节码")
-                for file_name in files:
-                    if file_name.endswith('.lock'):
-                        lock_file = Path(root) / file_name
-                        self._remove(lock_file, "锁文件")
-                for file_name in files:
-                    if file_name.endswith('.log'):
-                        log_file = Path(root) / file_name
-                        self._remove(log_file, "日志文件")
-            
-            # 清理构建文件
-            build_dirs = [
-                target_dir / "build",
-                target_dir / "dist",
-            ]
-            
-            for build_dir in build_dirs:
-                self._remove(build_dir, "构建文件")
-            
-            # 清理 egg-info 文件（使用通配符）
-            egg_info_pattern = str(target_dir / "*.egg-info")
-            import glob
-            for path in glob.glob(egg_info_pattern):
-                path_obj = Path(path)
-                self._remove(path_obj, "egg-info 文件")
-            
-            # 清理 poetry.lock 文件
-            poetry_lock_file = target_dir / "poetry.lock"
-            self._remove(poetry_lock_file, "Poetry 锁文件")
+            target_dirs.append(target_dir)
         
-        print("Python 缓存和构建文件清理完成!")
+        targets = {}
+        for target_dir in target_dirs:
+            # 构建文件、egg-info、poetry.lock
+            targets[target_dir / "build"] = "构建文件"
+            targets[target_dir / "dist"] = "构建文件"
+            for path in glob.glob(str(target_dir / "*.egg-info")):
+                targets[Path(path)] = "egg-info 文件"
+            targets[target_dir / "poetry.lock"] = "Poetry 锁文件"
+        
+        # Python缓存、字节码、锁文件和日志：单次遍历
+        file_rules = self.CLEAN_FILE_RULES + (((".log",), "日志文件"),)
+        self._scan_clean_targets(target_dirs, file_rules, targets)
+        if stale_only:
+            # 只清理过期字节码，保留仍然有效的缓存以免下次启动重新编译
+            for path, name in list(targets.items()):
+                if name == self.CLEAN_DIR_RULES["__pycache__"]:
+                    del targets[path]
+                    for stale in self._stale_bytecode(path):
+                        targets[stale] = "过期字节码"
+                elif name == "Python字节码":
+                    # __pycache__ 之外的字节码没有对应的失效信息，有同名源文件时保留
+                    if path.with_suffix(".py").exists():
+                        del targets[path]
+        
+        self._run_clean(targets, dry_run=dry_run)
+        print("Python 缓存和构建文件清理完成!" if not dry_run else "dry-run 完成!")
     
-    def build(self):
-        """构建前端并复制到后端"""
+    def build(self, force: bool = False, offline: bool = False):
+        """构建前端并复制到后端，构建输入未变化时跳过 npm；offline 时只从 vendor 的 npm 缓存安装依赖"""
         print("开始构建前端...")
         
         # 检查前端目录
@@ -316,11 +1461,21 @@ class LeekManager:
             print("错误: package.json不存在")
             return False
         
+        check_start = time.perf_counter()
+        if not force and self.frontend_build_state() == "current":
+            print(f"前端构建输入未变化，跳过构建（检查耗时 {(time.perf_counter() - check_start) * 1000:.1f}ms）")
+            return True
+        
         # 安装前端依赖
         print("安装前端依赖...")
-        if not self.run_command("npm install", cwd=self.frontend_dir):
+        npm_start = time.perf_counter()
+        if offline:
+            if not self._npm_install_offline():
+                return False
+        elif not self.run_command("npm install", cwd=self.frontend_dir):
             print("依赖安装失败")
             return False
+        npm_duration = time.perf_counter() - npm_start
         
         # 构建前端
         print("构建前端...")
@@ -339,21 +1494,223 @@ class LeekManager:
             print("错误: index.html不存在")
             return False
         
-        # 清空后端静态目录
+        # 增量同步到后端静态目录并原子切换
         backend_static = self.backend_dir / "static"
-        if backend_static.exists():
-            print("清空后端静态目录...")
-            shutil.rmtree(backend_static)
+        print("同步前端文件到后端...")
+        try:
+            self._sync_static(frontend_dist, backend_static)
+        except OSError as e:
+            print(f"同步前端文件失败: {e}")
+            return False
         
-        # 复制前端构建文件到后端
-        print("复制前端文件到后端...")
-        shutil.copytree(frontend_dist, backend_static)
+        # npm install 可能改写锁文件，构建成功后再记录输入哈希；保留在线安装耗时用于计算离线节省的时间
+        previous = self._read_state("build") or {}
+        self._write_state("build", {"inputs": self._frontend_inputs_digest(), "built_at": time.time(),
+                                    "online_npm_install_s": previous.get("online_npm_install_s") if offline else npm_duration})
+        if offline:
+            self._report_time_saved("npm 依赖安装", previous.get("online_npm_install_s"), npm_duration)
         
         print("构建完成!")
         print(f"前端构建目录: {frontend_dist}")
         print(f"后端静态目录: {backend_static}")
+        # 后端源码可能随前端一起更新，预编译 leek-core 和 leek-manager（依赖由 install 负责）
+        self.compile(site_packages=False)
         return True
     
+    @staticmethod
+    def _link_or_copy(src: Path, dst: Path, hardlink: bool = True) -> str:
+        """优先硬链接，其次 reflink，最后复制；返回实际使用的方式"""
+        if hardlink:
+            try:
+                os.link(src, dst)
+                return "link"
+            except OSError:
+                pass
+        try:
+            import fcntl
+            FICLONE = 0x40049409  # linux/fs.h
+            with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            shutil.copystat(src, dst)
+            return "reflink"
+        except (ImportError, OSError):
+            if dst.exists():
+                dst.unlink()
+        shutil.copy2(src, dst)
+        return "copy"
+
+    def _sync_static(self, source: Path, target: Path, keep: int = 2):
+        """
+        将 source 增量同步到 target：
+        在 .static-releases 下生成新版本目录，未变化的文件从当前版本硬链接复用，
+        变化的文件从 source reflink 或复制（不硬链接，避免 source 被原地修改时影响线上文件），
+        最后通过符号链接替换原子切换 target。
+        """
+        releases_dir = target.parent / ".static-releases"
+        releases_dir.mkdir(parents=True, exist_ok=True)
+        staging = releases_dir / str(time.time_ns())
+        current = target if target.is_dir() else None
+        stats = {"files_skipped": 0, "bytes_skipped": 0, "files_reflinked": 0, "files_copied": 0, "bytes_copied": 0}
+
+        for src in sorted(source.rglob("*")):
+            dst = staging / src.relative_to(source)
+            if src.is_dir():
+                dst.mkdir(parents=True, exist_ok=True)
+                continue
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            size = src.stat().st_size
+            old = current / src.relative_to(source) if current else None
+            if (old is not None and old.is_file() and old.stat().st_size == size
+                    and self._file_digest(old) == self._file_digest(src)):
+                self._link_or_copy(old, dst)
+                stats["files_skipped"] += 1
+                stats["bytes_skipped"] += size
+            elif self._link_or_copy(src, dst, hardlink=False) == "copy":
+                stats["files_copied"] += 1
+                stats["bytes_copied"] += size
+            else:
+                stats["files_reflinked"] += 1
+        staging.mkdir(parents=True, exist_ok=True)
+
+        self._precompress_static(staging, current)
+        self._swap_static(staging, target)
+
+        # 保留最近的几个版本，给切换前发起的请求留出读取时间
+        active = target.resolve()
+        releases = sorted((p for p in releases_dir.iterdir() if p.is_dir()), key=lambda p: p.name)
+        for release in releases[:-keep]:
+            if release.resolve() != active:
+                shutil.rmtree(release, ignore_errors=True)
+
+        print(f"静态文件同步完成: 未变化 {stats['files_skipped']} 个 ({stats['bytes_skipped']} 字节), "
+              f"reflink {stats['files_reflinked']} 个, 复制 {stats['files_copied']} 个 ({stats['bytes_copied']} 字节)")
+        return stats
+
+    @staticmethod
+    def _cache_class(rel: str) -> str:
+        """
+        Vite 输出到 assets/ 且文件名带内容哈希的资源可以长期缓存，其余每次校验。
+        哈希段须是扩展名前的 8 位 base64url（Vite 默认）或 8 位以上十六进制，且至少含一个数字，
+        避免把 `-component.js` 这类普通单词误判为哈希。
+        """
+        import re
+        if not rel.startswith("assets/"):
+            return "no-cache"
+        for pattern in (r"[-.]([A-Za-z0-9_-]{8})\.[^./]+$", r"[-.]([0-9a-f]{8,})\.[^./]+$"):
+            match = re.search(pattern, rel)
+            if match and any(c.isdigit() for c in match.group(1)):
+                return "immutable"
+        return "no-cache"
+
+    def _precompress_static(self, staging: Path, previous: Optional[Path] = None):
+        """
+        为 staging 中可压缩的资源生成 .gz/.br 并写入资源清单 asset-manifest.json，
+        内容未变化的文件直接复用上一版本的压缩结果，其余文件在进程池中并行压缩。
+        """
+        from concurrent.futures import ProcessPoolExecutor
+
+        old_manifest = {}
+        if previous is not None:
+            try:
+                with open(previous / ASSET_MANIFEST, "r", encoding="utf-8") as f:
+                    old_manifest = json.load(f).get("files", {})
+            except (OSError, ValueError):
+                pass
+
+        files, pending, reused_count = {}, [], 0
+        for path in sorted(p for p in staging.rglob("*") if p.is_file()):
+            rel = path.relative_to(staging).as_posix()
+            if rel == ASSET_MANIFEST:
+                continue
+            entry = {
+                "sha256": self._file_digest(path),
+                "size": path.stat().st_size,
+                "gzip": None,
+                "br": None,
+                "cache": self._cache_class(rel),
+            }
+            files[rel] = entry
+            if path.suffix.lower() not in COMPRESSIBLE_EXTENSIONS or entry["size"] < COMPRESS_MIN_SIZE:
+                continue
+            old = old_manifest.get(rel)
+            if old and old.get("sha256") == entry["sha256"]:
+                reused = True
+                for ext, key in ((".gz", "gzip"), (".br", "br")):
+                    if old.get(key) is None:
+                        continue
+                    sibling = previous / f"{rel}{ext}"
+                    if not sibling.is_file():
+                        reused = False
+                        break
+                    self._link_or_copy(sibling, staging / f"{rel}{ext}")
+                    entry[key] = old[key]
+                if reused:
+                    reused_count += 1
+                    continue
+            pending.append(rel)
+
+        if pending:
+            with ProcessPoolExecutor() as pool:
+                for rel, result in zip(pending, pool.map(_compress_asset, [str(staging / rel) for rel in pending])):
+                    files[rel].update(result)
+
+        with open(staging / ASSET_MANIFEST, "w", encoding="utf-8") as f:
+            json.dump({"generated_at": time.time(), "cache_control": CACHE_CONTROL, "files": files},
+                      f, ensure_ascii=False, indent=2, sort_keys=True)
+        print(f"预压缩静态资源: 压缩 {len(pending)} 个, 复用 {reused_count} 个")
+        self._print_size_report(old_manifest, files)
+
+    @staticmethod
+    def _print_size_report(old_files: dict, new_files: dict):
+        """对比上一版本资源清单，打印原始/gzip/br 体积变化"""
+        def total(files: dict, key: str) -> int:
+            return sum((e.get(key) if e.get(key) is not None else e["size"]) for e in files.values())
+
+        def fmt_delta(value: int) -> str:
+            return f"{'+' if value >= 0 else ''}{value / 1024:.1f}KB"
+
+        print("静态资源体积报告:")
+        for key, label in (("size", "原始"), ("gzip", "gzip"), ("br", "brotli")):
+            if key == "br" and not any(e.get("br") for e in new_files.values()):
+                continue
+            new_total = total(new_files, key)
+            line = f"  {label:<6} {new_total / 1024:10.1f}KB"
+            if old_files:
+                line += f"  ({fmt_delta(new_total - total(old_files, key))})"
+            print(line)
+        if old_files:
+            added = new_files.keys() - old_files.keys()
+            removed = old_files.keys() - new_files.keys()
+            changed = [k for k in new_files.keys() & old_files.keys() if new_files[k]["sha256"] != old_files[k].get("sha256")]
+            print(f"  新增 {len(added)} 个, 删除 {len(removed)} 个, 变化 {len(changed)} 个文件")
+            for rel in sorted(changed, key=lambda k: abs(new_files[k]["size"] - old_files[k]["size"]), reverse=True)[:5]:
+                print(f"    {rel}: {fmt_delta(new_files[rel]['size'] - old_files[rel]['size'])}")
+
+    @staticmethod
+    def _swap_static(staging: Path, target: Path):
+        """用符号链接替换原子切换 target 指向 staging；不支持符号链接时退化为目录重命名"""
+        link_tmp = target.with_name(f"{target.name}.tmp-{os.getpid()}")
+        try:
+            if link_tmp.is_symlink() or link_tmp.exists():
+                link_tmp.unlink()
+            os.symlink(os.path.relpath(staging, target.parent), link_tmp, target_is_directory=True)
+        except OSError:
+            link_tmp = None
+
+        legacy = target.with_name(f"{target.name}.old-{os.getpid()}")
+        if link_tmp is not None:
+            if target.is_symlink() or not target.exists():
+                os.replace(link_tmp, target)
+                return
+            # 首次从实体目录迁移为符号链接
+            os.replace(target, legacy)
+            os.replace(link_tmp, target)
+        else:
+            if target.exists() or target.is_symlink():
+                os.replace(target, legacy)
+            os.replace(staging, target)
+        shutil.rmtree(legacy, ignore_errors=True)
+
     def get_pid(self) -> Optional[int]:
         """获取运行中的PID"""
         if not self.pid_file.exists():
@@ -381,14 +1738,294 @@ class LeekManager:
             process_name = process.name().lower()
             cmdline = ' '.join(process.cmdline()).lower()
             
-            # 检查是否是 uvicorn 进程或者 Python 进程且包含 uvicorn
+            # 检查是否是 uvicorn 进程或者 Python 进程且包含 uvicorn（或是守护进程）
             return (process_name == 'uvicorn' or 
-                   (process_name.startswith('python') or 'python' in process_name) and 'uvicorn' in cmdline)
+                   (process_name.startswith('python') or 'python' in process_name) and ('uvicorn' in cmdline or '_serve' in cmdline or '_supervise' in cmdline))
         except psutil.NoSuchProcess:
             return False
     
-    def start(self, port=8009):
-        """后台启动服务，支持自定义端口"""
+    @staticmethod
+    def default_workers() -> int:
+        """默认 worker 数量：按 CPU 核数，最多 4 个（每个 worker 都是完整的应用进程）"""
+        return max(1, min(os.cpu_count() or 1, 4))
+
+    @staticmethod
+    def _tail(path: Path, lines: int = 20) -> list:
+        """从文件末尾按块向前读取最后若干行"""
+        try:
+            with open(path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                end = f.tell()
+                data = b""
+                while end > 0 and data.count(b"\n") <= lines:
+                    size = min(8192, end)
+                    end -= size
+                    f.seek(end)
+                    data = f.read(size) + data
+        except OSError:
+            return []
+        return data.decode("utf-8", errors="replace").splitlines()[-lines:]
+
+    @staticmethod
+    def _process_alive(pid: int) -> bool:
+        try:
+            return psutil.Process(pid).status() != psutil.STATUS_ZOMBIE
+        except psutil.NoSuchProcess:
+            return False
+
+    def _wait_ready(self, pid: int, port: int, timeout: float = 60, health_path: str = "/") -> bool:
+        """
+        等待服务就绪：先轮询 TCP 端口可连接（listening），再请求健康检查地址（healthy），
+        轮询间隔从 50ms 指数退避到 500ms；进程在启动期间退出时立即失败并打印日志末尾。
+        """
+        import socket
+        import urllib.request
+        import urllib.error
+
+        start_time = time.perf_counter()
+        deadline = start_time + timeout
+        interval = 0.05
+        listening_at = None
+        while time.perf_counter() < deadline:
+            if not self._process_alive(pid):
+                print(f"服务进程 (PID: {pid}) 在启动过程中退出，{self.log_file.name} 末尾日志:")
+                for line in self._tail(self.log_file, 30):
+                    print(f"  {line}")
+                return False
+            if listening_at is None:
+                try:
+                    with socket.create_connection(("127.0.0.1", port), timeout=interval):
+                        listening_at = time.perf_counter()
+                        print(f"端口已监听，耗时 {listening_at - start_time:.2f}s")
+                        continue
+                except OSError:
+                    pass
+            else:
+                try:
+                    with urllib.request.urlopen(f"http://127.0.0.1:{port}{health_path}", timeout=max(deadline - time.perf_counter(), 0.1)) as resp:
+                        status = resp.status
+                except urllib.error.HTTPError as e:
+                    status = e.code
+                except (OSError, ValueError):
+                    status = None
+                if status is not None and status < 500:
+                    print(f"健康检查通过 ({health_path} -> {status})，耗时 {time.perf_counter() - start_time:.2f}s")
+                    return True
+            time.sleep(interval)
+            interval = min(interval * 2, 0.5)
+        stage = "健康检查" if listening_at else "端口监听"
+        print(f"服务启动超时: {timeout}s 内未通过{stage}，{self.log_file.name} 末尾日志:")
+        for line in self._tail(self.log_file, 30):
+            print(f"  {line}")
+        return False
+
+    def _spawn_log_writer(self, log_options: Optional[dict] = None) -> subprocess.Popen:
+        """启动独立的日志写入进程，调用方通过其 stdin 写入日志"""
+        log_args = []
+        for key, value in (log_options or {}).items():
+            log_args += [f"--{key.replace('_', '-')}", str(value)]
+        return subprocess.Popen(
+            [sys.executable, str(Path(__file__).absolute()), "_logwriter", str(self.log_file)] + log_args,
+            stdin=subprocess.PIPE,
+            # 不继承调用方的输出，否则 `leek.py start | ...` 会一直等到日志写入进程退出
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+
+    def _server_command(self, port: int, workers: int, fd: Optional[int] = None, profile: str = "prod") -> list:
+        """服务启动命令，直接使用虚拟环境的解释器运行"""
+        if fd is not None:
+            # 以继承的 socket 启动，workers > 1 时由 uvicorn 主进程监管多个 worker 进程
+            return self._venv_command(str(Path(__file__).absolute()), "_serve", str(fd), "--workers", str(workers),
+                                      "--profile", profile)
+        cmd = self._venv_command("-m", "uvicorn", "app.main:app", "--host", "0.0.0.0", "--port", str(port),
+                                 *_uvicorn_cli_args(profile))
+        if workers > 1:
+            # workers > 1 时由 uvicorn 主进程监管多个 worker 进程
+            cmd += ["--workers", str(workers)]
+        return cmd
+
+    @staticmethod
+    def _server_socket(port: int):
+        """
+        创建可被子进程继承的 socket；SO_REUSEPORT 允许新旧实例同时绑定同一端口。
+        这里只绑定不监听：uvicorn 在应用启动完成后才调用 listen()，
+        避免内核把连接分配给尚未就绪的新实例
+        """
+        import socket
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if hasattr(socket, "SO_REUSEPORT"):
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind(("0.0.0.0", port))
+            sock.set_inheritable(True)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _spawn_server(self, cmd: list, log_options: Optional[dict] = None, log_stream=None, cwd: Optional[Path] = None,
+                      pass_fds: tuple = ()) -> subprocess.Popen:
+        """
+        在新会话中后台启动进程（替代 nohup），输出写入 log_stream，
+        未提供时交给新启动的日志写入进程
+        """
+        print(f"执行命令: {' '.join(cmd)}")
+        writer = None
+        if log_stream is None:
+            writer = self._spawn_log_writer(log_options)
+            log_stream = writer.stdin
+        try:
+            return subprocess.Popen(
+                cmd,
+                cwd=cwd or self.backend_dir,
+                stdin=subprocess.DEVNULL,
+                stdout=log_stream,
+                stderr=subprocess.STDOUT,
+                start_new_session=True,
+                pass_fds=pass_fds,
+            )
+        finally:
+            if writer is not None:
+                # 只保留服务进程持有管道写端，服务退出后日志写入进程读到 EOF 自动退出
+                writer.stdin.close()
+
+    def _spawn_bound_server(self, port: int, workers: int, log_options: Optional[dict] = None,
+                                log_stream=None, profile: str = "prod") -> subprocess.Popen:
+        """绑定端口并以继承的 socket 启动服务（不支持时退化为 uvicorn 自行绑定端口）"""
+        if not self.SHARED_SOCKET:
+            return self._spawn_server(self._server_command(port, workers, profile=profile), log_options, log_stream)
+        sock = self._server_socket(port)
+        try:
+            return self._spawn_server(self._server_command(port, workers, fd=sock.fileno(), profile=profile),
+                                      log_options, log_stream, pass_fds=(sock.fileno(),))
+        finally:
+            sock.close()
+
+    def _wait_started(self, pid: int, ready_file: Path, expected: int, timeout: float = 60) -> bool:
+        """等待日志写入进程统计到的应用启动完成次数达到 expected（每个 worker 一次）"""
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            if not self._process_alive(pid):
+                return False
+            try:
+                if int(ready_file.read_text(encoding="utf-8") or 0) >= expected:
+                    return True
+            except (OSError, ValueError):
+                pass
+            time.sleep(0.05)
+        return False
+
+    @staticmethod
+    def _wait_listening(pid: int, port: int, timeout: float = 60) -> bool:
+        """等待 pid 的进程树中出现监听 port 的 socket（只绑定未监听的继承 socket 不算）"""
+        start_time = time.perf_counter()
+        deadline = start_time + timeout
+        while time.perf_counter() < deadline:
+            try:
+                root = psutil.Process(pid)
+                processes = [root] + root.children(recursive=True)
+            except psutil.NoSuchProcess:
+                return False
+            for process in processes:
+                try:
+                    connections = process.net_connections(kind="inet") if hasattr(process, "net_connections") else process.connections(kind="inet")
+                except (psutil.NoSuchProcess, psutil.AccessDenied):
+                    continue
+                if any(c.status == psutil.CONN_LISTEN and c.laddr and c.laddr.port == port for c in connections):
+                    print(f"新实例已监听端口 {port}，耗时 {time.perf_counter() - start_time:.2f}s")
+                    return True
+            time.sleep(0.05)
+        print(f"新实例 {timeout}s 内未监听端口 {port}")
+        return False
+
+    def _graceful_stop(self, process, timeout: float = 30):
+        """向主进程发送 SIGTERM 让 uvicorn 处理完进行中的请求后退出，超时后强制停止整个进程树"""
+        self._stop_process_tree(process, timeout)
+
+    @staticmethod
+    def _apply_scheduling(pid: int, scheduling: Optional[dict], tree: bool = True) -> dict:
+        """
+        把 CPU 亲和性（cpu_affinity）、nice 和 ionice 设置应用到进程，tree 为 True 时包括所有子进程；
+        之后派生的 worker 进程从父进程继承这些设置。返回成功应用到所有进程的设置，失败的项打印原因后去掉
+        """
+        if not scheduling:
+            return {}
+        try:
+            master = psutil.Process(pid)
+            processes = [master] + (master.children(recursive=True) if tree else [])
+        except psutil.NoSuchProcess:
+            return {}
+        appliers = {
+            "cpu_affinity": lambda process, value: process.cpu_affinity(value),
+            "nice": lambda process, value: process.nice(_psutil_nice(value)),
+            "ionice": lambda process, value: process.ionice(*_psutil_ionice(value)),
+        }
+        applied = {key: value for key, value in scheduling.items() if value is not None}
+        for process in processes:
+            for key, apply in appliers.items():
+                if key not in applied:
+                    continue
+                try:
+                    apply(process, applied[key])
+                except psutil.NoSuchProcess:
+                    break
+                except psutil.AccessDenied:
+                    print(f"调整进程 {process.pid} 的 {key} 被拒绝（提高优先级需要 root 权限）")
+                    del applied[key]
+                except (AttributeError, ValueError, OSError) as e:
+                    # macOS 不支持 CPU 亲和性和 ionice；CPU 编号超出范围时为 ValueError
+                    print(f"调整进程 {process.pid} 的 {key} 失败: {str(e) or '当前平台不支持'}")
+                    del applied[key]
+        return applied
+
+    @staticmethod
+    def _check_scheduling(scheduling: dict) -> bool:
+        """启动前检查 CPU 编号是否存在，避免服务启动后才发现设置无法生效"""
+        invalid = set(scheduling.get("cpu_affinity") or ()) - set(range(psutil.cpu_count() or 1))
+        if invalid:
+            print(f"CPU 编号不存在: {format_cpu_list(invalid)}（可用: 0-{(psutil.cpu_count() or 1) - 1}）")
+            return False
+        return True
+
+    def _report_scheduling(self, requested: dict, applied: dict) -> dict:
+        """打印实际生效的调度设置和未生效的项，返回生效的设置用于记录到状态文件"""
+        failed = {key: value for key, value in requested.items() if value is not None and key not in applied}
+        if applied:
+            print(f"调度设置: {self._format_scheduling(applied)}")
+        if failed:
+            print(f"未生效的调度设置: {self._format_scheduling(failed)}")
+        return applied
+
+    @staticmethod
+    def _format_scheduling(scheduling: dict) -> str:
+        parts = []
+        if scheduling.get("cpu_affinity"):
+            parts.append(f"CPU {format_cpu_list(scheduling['cpu_affinity'])}")
+        if scheduling.get("nice") is not None:
+            parts.append(f"nice {scheduling['nice']}")
+        if scheduling.get("ionice"):
+            parts.append(f"ionice {scheduling['ionice']}")
+        return ", ".join(parts)
+
+    def start(self, port=8009, workers: Optional[int] = None, timeout: float = 60, health_path: str = "/",
+              log_options: Optional[dict] = None, supervise: bool = False, supervise_options: Optional[dict] = None,
+              profile: Optional[str] = None, scheduling: Optional[dict] = None):
+        """
+        后台启动服务，支持自定义端口和 worker 数量，等待端口监听且健康检查通过后返回；
+        supervise 为 True 时启动守护进程，由守护进程拉起服务并在崩溃时自动重启。
+        profile 选择 uvicorn 启动配置，未指定时读取 ENVIRONMENT，默认 prod；
+        scheduling 为服务进程树的 CPU 亲和性、nice 和 ionice 设置，未指定 worker 数时按亲和的 CPU 数计算
+        """
+        scheduling = scheduling or {}
+        if not self._check_scheduling(scheduling):
+            return False
+        if scheduling.get("cpu_affinity") and not workers:
+            workers = min(len(scheduling["cpu_affinity"]), 4)
+        workers = workers or self.default_workers()
+        profile = resolve_profile(profile)
         # 启动前自动安装依赖
         if not self.install():
             print("依赖安装失败，无法启动服务")
@@ -397,32 +2034,116 @@ class LeekManager:
         if not self.check_uvicorn():
             print("uvicorn 检查失败，无法启动服务")
             return False
-        if self.is_running():
-            print("服务已在运行中")
-            return True
-        print("启动服务...")
-        try:
-            # 使用 poetry run 来确保在正确的虚拟环境中运行
-            cmd = f"nohup {sys.executable} -m poetry run uvicorn app.main:app --host 0.0.0.0 --port {port} > ../leek.log 2>&1 & echo $! > {self.pid_file}"
-            ct = 0
-            r = self.run_command(cmd, cwd=self.backend_dir, capture_output=False)
-            while r:
-                time.sleep(1)
-                ct += 1
+        try:
+            # 检查端口占用到记录 PID 和端口期间持有跨实例的锁，避免同时启动的两个实例都认为端口空闲
+            with self._port_lock():
                 if self.is_running():
-                    print(f"服务启动成功! 访问地址: http://localhost:{port}")
+                    print("服务已在运行中")
                     return True
-                elif ct > 10:
-                    print("服务启动失败")
+                # SO_REUSEPORT 允许多个实例绑定同一端口，需要显式检查端口是否已被其他实例占用
+                owner = self._port_owner(port)
+                if owner:
+                    print(f"端口 {port} 已被实例 {owner} 使用")
                     return False
-            print("启动命令执行失败")
-            return False
+                print(f"启动服务{f' (实例: {self.name})' if self.name else ''}...")
+                self.instance_dir.mkdir(parents=True, exist_ok=True)
+                if supervise:
+                    # PID 文件记录守护进程，服务进程由守护进程管理
+                    cmd = [sys.executable, str(Path(__file__).absolute()), "_supervise", str(port), "--workers",
+                           str(workers), "--profile", profile]
+                    if self.name:
+                        cmd += ["--name", self.name]
+                    for key, value in {**(log_options or {}), **(supervise_options or {})}.items():
+                        cmd += [f"--{key.replace('_', '-')}", str(value)]
+                    pid = self._spawn_server(cmd, log_stream=subprocess.DEVNULL, cwd=self.project_root).pid
+                else:
+                    # PID 文件记录 uvicorn 主进程
+                    pid = self._spawn_bound_server(port, workers, log_options, profile=profile).pid
+                with open(self.pid_file, "w") as f:
+                    f.write(str(pid))
+                service = {"pid": pid, "port": port, "workers": workers, "started_at": time.time(),
+                           "supervised": supervise, "shared_socket": self.SHARED_SOCKET,
+                           "log_options": log_options or {}, "profile": profile, "scheduling": {}}
+                # 先记录端口，就绪前其他实例的端口检查也能看到
+                self._write_state("service", service)
+            # 启动后立即设置，worker 进程派生时继承；就绪后再覆盖整个进程树
+            self._apply_scheduling(pid, scheduling, tree=False)
+            if not self._wait_ready(pid, port, timeout=timeout, health_path=health_path):
+                print("服务启动失败")
+                self._abort_start(pid)
+                return False
+            scheduling = self._report_scheduling(scheduling, self._apply_scheduling(pid, scheduling))
+            self._write_state("service", {**service, "started_at": time.time(), "scheduling": scheduling})
+            print(f"服务启动成功!{' (守护模式)' if supervise else ''} 配置: {profile}, worker 数: {workers}, "
+                  f"访问地址: http://localhost:{port}")
+            return True
         except Exception as e:
             print(f"启动服务异常: {e}")
             return False
     
-    def stop(self):
-        """停止服务"""
+    def _abort_start(self, pid: int):
+        """启动未就绪时停止已拉起的进程树并删除 PID 文件，避免留下半启动的服务"""
+        try:
+            self._stop_process_tree(psutil.Process(pid), timeout=5)
+        except psutil.NoSuchProcess:
+            pass
+        if self.pid_file.exists():
+            self.pid_file.unlink()
+
+    @property
+    def label(self) -> str:
+        return self.name or "default"
+
+    def instance_names(self) -> list:
+        """所有实例名：默认实例（None）在前，其后为 .leek/run 下的命名实例"""
+        names = [None]
+        if self.run_dir.is_dir():
+            names += sorted(path.name for path in self.run_dir.iterdir() if path.is_dir())
+        return names
+
+    @contextmanager
+    def _port_lock(self):
+        """.leek/run/port.lock 上的排他锁（POSIX 用 flock，Windows 用 msvcrt.locking），进程退出时自动释放"""
+        self.run_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.run_dir / "port.lock", "a+b") as f:
+            if os.name == "nt":
+                import msvcrt
+                f.seek(0)
+                while True:
+                    try:
+                        # LK_LOCK 重试 10 秒后仍未拿到锁时抛出 OSError，继续等待
+                        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        continue
+                try:
+                    yield
+                finally:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _port_owner(self, port: int) -> Optional[str]:
+        """返回正在使用该端口的其他实例名"""
+        for name in self.instance_names():
+            if name == self.name:
+                continue
+            other = LeekManager(name)
+            if other.is_running() and other._service_info().get("port") == port:
+                return other.label
+        return None
+
+    def stop(self, timeout: float = 30):
+        """
+        停止服务：向主进程（守护模式下为守护进程）发送 SIGTERM 优雅停止，
+        整个进程树在 timeout 秒内未退出的进程强制终止，并打印各阶段耗时
+        """
         pid = self.get_pid()
         if pid is None:
             print("服务未运行")
@@ -431,9 +2152,12 @@ class LeekManager:
         try:
             process = psutil.Process(pid)
             print(f"停止服务 (PID: {pid})...")
-            
-            # 递归杀死进程及其所有子进程
-            self._kill_process_tree(process)
+            if self._is_supervisor(process):
+                # 守护进程收到 SIGTERM 后停止服务再退出，不会把服务重新拉起
+                print("通知守护进程停止...")
+            timings = self._stop_process_tree(process, timeout)
+            print(f"停止耗时: 等待退出 {timings['drain']:.2f}s（{timings['processes']} 个进程），"
+                  f"强制终止 {timings['kill']:.2f}s（{timings['killed']} 个进程）")
             
             # 清理PID文件
             if self.pid_file.exists():
@@ -450,63 +2174,881 @@ class LeekManager:
             print(f"停止服务异常: {e}")
             return False
     
-    def _kill_process_tree(self, process):
-        """递归杀死进程及其所有子进程"""
+    @staticmethod
+    def _is_supervisor(process) -> bool:
         try:
-            # 获取所有子进程
-            children = process.children(recursive=True)
-            
-            # 先杀死子进程
-            for child in children:
+            return "_supervise" in process.cmdline()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            return False
+
+    def supervise(self, port: int, workers: int, log_options: Optional[dict] = None, max_restarts: int = 5,
+                  restart_window: float = 300, max_rss_mb: Optional[float] = None, max_cpu: Optional[float] = None,
+                  watchdog_interval: float = 5, watchdog_samples: int = 3, profile: str = "prod"):
+        """
+        守护进程主循环：持有服务 socket 和日志管道，拉起服务并等待其退出。
+        - 意外退出时按指数退避（1s 起，最长 60s）重启，restart_window 秒内重启超过 max_restarts 次视为崩溃循环并放弃
+        - 进程树 RSS 超过 max_rss_mb，或 CPU 连续 watchdog_samples 次超过 max_cpu% 时主动重启
+        - SIGTERM/SIGINT 停止服务并退出；SIGHUP 滚动重启：新实例共用同一个 socket 启动完成后再停止旧实例
+        重启事件记录到 supervisor-events.jsonl（默认实例在 .leek 下，命名实例在实例目录下）和服务日志
+        """
+        import signal
+        from collections import deque
+
+        self.instance_dir.mkdir(parents=True, exist_ok=True)
+        ready_file = self.instance_dir / f"ready-{os.getpid()}"
+        writer = self._spawn_log_writer({**(log_options or {}), "ready_file": ready_file})
+        log = writer.stdin
+        sock = self._server_socket(port) if self.SHARED_SOCKET else None
+        events_file = self.instance_dir / "supervisor-events.jsonl"
+        flags = {"stop": False, "restart": False}
+
+        def on_stop(signum, frame):
+            flags["stop"] = True
+
+        def on_restart(signum, frame):
+            flags["restart"] = True
+
+        signal.signal(signal.SIGTERM, on_stop)
+        signal.signal(signal.SIGINT, on_stop)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, on_restart)
+
+        def record(event: str, **fields):
+            entry = {"ts": time.time(), "event": event, **fields}
+            with open(events_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            try:
+                log.write(f"[supervisor] {time.strftime('%Y-%m-%d %H:%M:%S')} {event} {json.dumps(fields, ensure_ascii=False)}\n".encode())
+                log.flush()
+            except OSError:
+                pass
+
+        def ready_count() -> int:
+            try:
+                return int(ready_file.read_text(encoding="utf-8") or 0)
+            except (OSError, ValueError):
+                return 0
+
+        def spawn() -> subprocess.Popen:
+            if sock is None:
+                return self._spawn_server(self._server_command(port, workers, profile=profile), log_stream=log)
+            return self._spawn_server(self._server_command(port, workers, fd=sock.fileno(), profile=profile),
+                                      log_stream=log, pass_fds=(sock.fileno(),))
+
+        def save_state(server, generation, last_restart_ok=True):
+            self._write_state("supervisor", {"pid": os.getpid(), "server_pid": server.pid, "port": port, "workers": workers,
+                                             "restarts": restarts, "server_started_at": time.time(),
+                                             "generation": generation, "last_restart_ok": last_restart_ok})
+
+        crashes = deque()
+        backoff = 1.0
+        restarts = 0
+        generation = 0
+        server = None
+        record("supervisor-start", pid=os.getpid(), port=port, workers=workers)
+        while not flags["stop"]:
+            if server is None:
+                server = spawn()
+                started = time.time()
+                save_state(server, generation)
+                record("server-start", server_pid=server.pid, restarts=restarts)
+
+            tree, cpu_high, reason, returncode = {}, 0, None, None
+            next_check = time.time() + watchdog_interval
+            while True:
                 try:
-                    print(f"  停止子进程 (PID: {child.pid})...")
-                    child.terminate()
+                    returncode = server.wait(timeout=0.5)
+                    reason = "exit"
+                    break
+                except subprocess.TimeoutExpired:
+                    pass
+                if flags["stop"] or flags["restart"]:
+                    break
+                if (max_rss_mb or max_cpu) and time.time() >= next_check:
+                    next_check = time.time() + watchdog_interval
+                    try:
+                        master = psutil.Process(server.pid)
+                        procs = [master] + master.children(recursive=True)
+                    except psutil.NoSuchProcess:
+                        continue
+                    # 复用 Process 对象，cpu_percent 基于上一次检查计算
+                    tree = {p.pid: tree.get(p.pid, p) for p in procs}
+                    rss, cpu = 0, 0.0
+                    for proc in tree.values():
+                        try:
+                            rss += proc.memory_info().rss
+                            cpu += proc.cpu_percent(None)
+                        except psutil.NoSuchProcess:
+                            continue
+                    if max_rss_mb and rss / 1024 / 1024 > max_rss_mb:
+                        reason = f"rss {rss / 1024 / 1024:.0f}MB > {max_rss_mb}MB"
+                        break
+                    cpu_high = cpu_high + 1 if max_cpu and cpu > max_cpu else 0
+                    if cpu_high >= watchdog_samples:
+                        reason = f"cpu {cpu:.0f}% > {max_cpu}% ({watchdog_samples} 次)"
+                        break
+
+            if flags["stop"]:
+                if returncode is None:
+                    self._graceful_stop(psutil.Process(server.pid))
+                    server.wait()
+                record("server-stop", server_pid=server.pid)
+                break
+
+            if returncode is None:
+                # 主动重启（SIGHUP 或看门狗）：滚动替换，旧实例在新实例就绪前继续提供服务
+                flags["restart"] = False
+                restarts += 1
+                generation += 1
+                expected = ready_count() + workers
+                new_server = spawn()
+                if self._wait_started(new_server.pid, ready_file, expected, timeout=120):
+                    old_pid = server.pid
+                    self._graceful_stop(psutil.Process(old_pid))
+                    server.wait()
+                    server, started = new_server, time.time()
+                    save_state(server, generation)
+                    record("rolling-restart", reason=reason or "requested", old_pid=old_pid, server_pid=server.pid)
+                else:
+                    try:
+                        self._stop_process_tree(psutil.Process(new_server.pid), timeout=5)
+                    except psutil.NoSuchProcess:
+                        pass
+                    new_server.wait()
+                    save_state(server, generation, last_restart_ok=False)
+                    record("rolling-restart-failed", reason=reason or "requested", server_pid=server.pid)
+                backoff = 1.0
+                continue
+
+            restarts += 1
+            server = None
+            now = time.time()
+            if now - started > restart_window:
+                backoff = 1.0  # 稳定运行过一段时间，重置退避
+            crashes.append(now)
+            while crashes and now - crashes[0] > restart_window:
+                crashes.popleft()
+            if len(crashes) > max_restarts:
+                record("crash-loop", exit_code=returncode, crashes=len(crashes), window=restart_window)
+                break
+            record("crash", exit_code=returncode, backoff=backoff)
+            wake = time.time() + backoff
+            while time.time() < wake and not flags["stop"]:
+                time.sleep(0.1)
+            backoff = min(backoff * 2, 60.0)
+
+        record("supervisor-exit", restarts=restarts)
+        log.close()
+        if sock is not None:
+            sock.close()
+        try:
+            ready_file.unlink()
+        except OSError:
+            pass
+        if self.get_pid() == os.getpid() and self.pid_file.exists():
+            self.pid_file.unlink()
+        return True
+
+    @staticmethod
+    def _stop_process_tree(process, timeout: float = 30) -> dict:
+        """
+        优雅停止进程树：只向主进程发送 SIGTERM，由 uvicorn 主进程通知各 worker 处理完进行中的请求（drain）
+        并执行应用的 shutdown 后退出；主进程退出后仍存活的子进程再各自收到 SIGTERM。
+        整棵树共用一个截止时间，由 psutil.wait_procs 同时等待，超时仍存活的进程才发送 SIGKILL。
+        返回各阶段耗时（秒）和进程数
+        """
+        started = time.perf_counter()
+        try:
+            children = process.children(recursive=True)
+            process.terminate()
+        except psutil.NoSuchProcess:
+            return {"drain": 0.0, "kill": 0.0, "processes": 0, "killed": 0}
+
+        def on_exit(proc):
+            if proc.pid == process.pid:
+                # 主进程已退出，残留的子进程不会再收到主进程转发的信号
+                for child in children:
                     try:
-                        child.wait(timeout=3)
-                    except psutil.TimeoutExpired:
-                        print(f"  强制终止子进程 {child.pid}...")
-                        child.kill()
+                        child.terminate()
+                    except psutil.NoSuchProcess:
+                        pass
+
+        # 记录收集时的父进程，用于判断僵尸进程的父进程是否已经退出
+        parents = {}
+        for proc in [process] + children:
+            try:
+                parents[proc.pid] = proc.ppid()
+            except psutil.NoSuchProcess:
+                pass
+
+        def exited(proc) -> bool:
+            """进程已不存在，或是父进程已退出（由 init 或 subreaper 收养）的僵尸进程"""
+            try:
+                if proc.status() != psutil.STATUS_ZOMBIE:
+                    return False
+                ppid = proc.ppid()
+                return ppid <= 1 or ppid != parents.get(proc.pid) or not psutil.pid_exists(ppid)
+            except psutil.NoSuchProcess:
+                return True
+
+        def wait(procs: list, deadline: float) -> list:
+            """psutil.wait_procs 按短间隔轮询直到 deadline，返回仍存活的进程"""
+            while procs and time.perf_counter() < deadline:
+                _, procs = psutil.wait_procs(procs, timeout=min(0.1, max(0.0, deadline - time.perf_counter())),
+                                             callback=on_exit)
+                # 父进程已退出的僵尸进程由 init 回收，容器中可能不及时，视为已退出；
+                # 父进程仍在的僵尸进程由父进程回收，继续等待
+                zombies = [proc for proc in procs if exited(proc)]
+                for proc in zombies:
+                    on_exit(proc)
+                procs = [proc for proc in procs if proc not in zombies]
+            return procs
+
+        alive = wait([process] + children, started + timeout)
+        drained = time.perf_counter()
+        if alive:
+            # 等待期间存活的进程可能又派生了子进程（如 uvicorn 重新拉起 worker），强制终止前重新收集
+            known = {proc.pid for proc in alive}
+            for proc in list(alive):
+                try:
+                    descendants = proc.children(recursive=True)
+                except psutil.NoSuchProcess:
+                    continue
+                for child in descendants:
+                    if child.pid not in known:
+                        known.add(child.pid)
+                        alive.append(child)
+            print(f"{len(alive)} 个进程未在 {timeout:g}s 内退出，强制终止: {', '.join(str(p.pid) for p in alive)}")
+            for proc in alive:
+                try:
+                    proc.kill()
                 except psutil.NoSuchProcess:
                     pass
-                except Exception as e:
-                    print(f"  停止子进程 {child.pid} 异常: {e}")
-            
-            # 再杀死主进程
-            process.terminate()
+            wait(alive, drained + 5)
+        return {"drain": drained - started, "kill": time.perf_counter() - drained,
+                "processes": len(children) + 1, "killed": len(alive)}
+
+    def _rolling_restart(self, port: int, workers: int, timeout: float, profile: str, scheduling: dict) -> bool:
+        """
+        非守护模式的滚动重启：新实例用新的 SO_REUSEPORT socket 监听同一端口，
+        所有 worker 启动完成且新实例自己开始监听后写入 PID 文件，再让旧实例处理完进行中的请求后退出
+        """
+        old_pid = self.get_pid()
+        info = self._service_info()
+        ready_file = self.instance_dir / f"ready-{time.time_ns()}"
+        self.instance_dir.mkdir(parents=True, exist_ok=True)
+        log_options = {**info.get("log_options", {}), "ready_file": ready_file}
+        try:
+            new_server = self._spawn_bound_server(port, workers, log_options, profile=profile)
+            self._apply_scheduling(new_server.pid, scheduling, tree=False)
+            # 共用端口时旧实例仍在应答，端口探测和健康检查无法区分新旧实例，
+            # 只以新实例自己的就绪标记和其进程树上的监听 socket 作为判断依据
+            if not (self._wait_started(new_server.pid, ready_file, workers, timeout)
+                    and self._wait_listening(new_server.pid, port, timeout)):
+                print("新实例启动失败，保留旧实例继续运行")
+                try:
+                    self._stop_process_tree(psutil.Process(new_server.pid), timeout=5)
+                except psutil.NoSuchProcess:
+                    pass
+                return False
+            scheduling = self._report_scheduling(scheduling, self._apply_scheduling(new_server.pid, scheduling))
+            with open(self.pid_file, "w") as f:
+                f.write(str(new_server.pid))
+            self._write_state("service", {**info, "pid": new_server.pid, "workers": workers, "started_at": time.time(),
+                                          "profile": profile, "scheduling": scheduling})
+            print(f"新实例已就绪 (PID: {new_server.pid})，停止旧实例 (PID: {old_pid})...")
             try:
-                process.wait(timeout=5)
-            except psutil.TimeoutExpired:
-                print("强制终止主进程...")
-                process.kill()
-                
-        except psutil.NoSuchProcess:
-            pass
-        except Exception as e:
-            print(f"杀死进程树异常: {e}")
-    
-    def restart(self, port=8009):
+                self._graceful_stop(psutil.Process(old_pid))
+            except psutil.NoSuchProcess:
+                pass
+            return True
+        finally:
+            try:
+                ready_file.unlink()
+            except OSError:
+                pass
+
+    def restart(self, port: Optional[int] = None, workers: Optional[int] = None, timeout: float = 60,
+                health_path: str = "/", profile: Optional[str] = None, scheduling: Optional[dict] = None):
+        """
+        重启服务：端口和 worker 数不变时滚动重启（新实例就绪后再停止旧实例，期间服务不中断），
+        否则先停止再启动。port 未指定时沿用当前实例的端口（默认 8009）；
+        profile 未指定时读取 ENVIRONMENT，否则沿用当前实例的配置；
+        scheduling 中指定的调度设置覆盖当前实例的对应项
+        """
+        import signal
         print("重启服务...")
+        info = self._service_info()
+        port = port or info.get("port") or 8009
+        pid = self.get_pid()
+        profile = resolve_profile(profile, default=info.get("profile", "prod"))
+        scheduling = {**info.get("scheduling", {}), **(scheduling or {})}
+        if not self._check_scheduling(scheduling):
+            return False
+        rolling = (self.is_running() and info.get("port") == port
+                   and (workers is None or workers == info.get("workers")))
+        supervisor = self._read_state("supervisor") or {}
+        supervised = rolling and supervisor.get("pid") == pid and hasattr(signal, "SIGHUP")
+        # 守护进程按启动时的配置拉起服务，切换配置需要重新启动守护进程
+        if supervised and profile != info.get("profile", "prod"):
+            rolling = supervised = False
+        if rolling and (supervised or info.get("shared_socket")):
+            if not self.install():
+                print("依赖安装失败，保留当前实例继续运行")
+                return False
+            probe = _AvailabilityProbe(port, health_path).start()
+            start_time = time.perf_counter()
+            if supervised:
+                # 守护模式：通知守护进程滚动重启
+                print(f"通知守护进程 (PID: {pid}) 滚动重启服务...")
+                generation = supervisor.get("generation", 0)
+                os.kill(pid, signal.SIGHUP)
+                ok = False
+                deadline = time.time() + timeout + 30
+                while time.time() < deadline:
+                    state = self._read_state("supervisor") or {}
+                    if state.get("generation", 0) > generation:
+                        ok = bool(state.get("last_restart_ok"))
+                        break
+                    time.sleep(0.1)
+                else:
+                    print("守护进程未按时完成重启")
+                if ok and scheduling != info.get("scheduling", {}):
+                    # 守护进程按新设置调整后，之后拉起的服务进程都会继承
+                    scheduling = self._report_scheduling(scheduling, self._apply_scheduling(pid, scheduling))
+                    self._write_state("service", {**info, "scheduling": scheduling})
+            else:
+                ok = self._rolling_restart(port, info.get("workers") or self.default_workers(), timeout, profile,
+                                           scheduling)
+            probe.stop()
+            print(f"滚动重启{'完成' if ok else '失败'}，耗时 {time.perf_counter() - start_time:.1f}s")
+            return ok
         if self.stop():
             time.sleep(2)
-            return self.start(port=port)
+            return self.start(port=port, workers=workers, supervise=bool(info.get("supervised")), profile=profile,
+                              scheduling=scheduling)
         return False
     
+    def _running_instances(self) -> list:
+        return [manager for manager in map(LeekManager, self.instance_names()) if manager.is_running()]
+
+    def stop_all(self, timeout: float = 30) -> bool:
+        """并发停止所有运行中的实例，总耗时约等于最慢的一个"""
+        managers = self._running_instances()
+        if not managers:
+            print("没有运行中的实例")
+            return True
+        return self.run_task_graph({
+            manager.label: (lambda manager=manager: manager.stop(timeout=timeout), []) for manager in managers
+        })
+
+    def restart_all(self, timeout: float = 60, health_path: str = "/", workers: Optional[int] = None,
+                    profile: Optional[str] = None, scheduling: Optional[dict] = None) -> bool:
+        """
+        并发重启所有运行中的实例，总耗时约等于最慢的一个。各实例沿用记录的端口，
+        workers、profile 和 scheduling 指定时应用到每个实例，未指定的沿用各实例的设置。
+        依赖检查先执行一次，各实例重启时指纹已一致，不会并发执行安装
+        """
+        managers = self._running_instances()
+        if not managers:
+            print("没有运行中的实例")
+            return True
+        if not self.install():
+            print("依赖安装失败，保留当前实例继续运行")
+            return False
+        return self.run_task_graph({
+            manager.label: (lambda manager=manager: manager.restart(timeout=timeout, health_path=health_path,
+                                                                    workers=workers, profile=profile,
+                                                                    scheduling=scheduling), [])
+            for manager in managers
+        })
+
+    def _service_info(self) -> dict:
+        """读取启动时记录的服务信息（端口、worker 数等），PID 不一致时视为过期"""
+        info = self._read_state("service") or {}
+        if info.get("pid") != self.get_pid():
+            return {}
+        return info
+
+    @staticmethod
+    def _format_uptime(seconds: float) -> str:
+        seconds = int(seconds)
+        days, seconds = divmod(seconds, 86400)
+        hours, seconds = divmod(seconds, 3600)
+        minutes, seconds = divmod(seconds, 60)
+        text = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+        return f"{days}d {text}" if days else text
+
+    @staticmethod
+    def _process_role(process, top: bool = False) -> str:
+        """根据命令行判断进程在服务进程树中的角色"""
+        try:
+            cmdline = " ".join(process.cmdline())
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            return "unknown"
+        if "_supervise" in cmdline:
+            return "supervisor"
+        if "_logwriter" in cmdline:
+            return "logger"
+        if "resource_tracker" in cmdline:
+            return "helper"
+        if top or "uvicorn" in cmdline or "_serve" in cmdline:
+            return "master"
+        return "worker"
+
+    def _print_processes(self, pid: int, scheduling: bool = False):
+        """列出主进程及各 worker 的 PID 和运行时长，scheduling 为 True 时附带各进程实际的 CPU 亲和性和 nice"""
+        try:
+            master = psutil.Process(pid)
+            now = time.time()
+            for process in [master] + master.children(recursive=True):
+                try:
+                    role = self._process_role(process, top=process is master)
+                    line = f"  {role:<10} PID {process.pid:<8} 运行时长 {self._format_uptime(now - process.create_time())}"
+                    if scheduling:
+                        if hasattr(process, "cpu_affinity"):
+                            line += f"  CPU {format_cpu_list(process.cpu_affinity())}"
+                        line += f"  nice {process.nice()}"
+                    print(line)
+                except (psutil.NoSuchProcess, psutil.AccessDenied):
+                    continue
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            pass
+
+    def _read_supervisor_events(self, limit: int = 10) -> list:
+        events = []
+        for line in self._tail(self.instance_dir / "supervisor-events.jsonl", limit):
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                continue
+        return events
+
+    def _print_instance_table(self):
+        """以表格列出所有实例：运行状态、PID、端口、worker 数、启动配置、运行时长和守护进程重启次数"""
+        print(f"{'INSTANCE':<16}{'STATE':<9}{'PID':>8}{'PORT':>7}{'WORKERS':>9}  {'PROFILE':<12}{'UPTIME':<14}{'RESTARTS':>8}")
+        now = time.time()
+        for name in self.instance_names():
+            manager = LeekManager(name)
+            running = manager.is_running()
+            pid = manager.get_pid() if running else None
+            # 未运行的实例显示最后一次启动时记录的端口等信息
+            info = manager._service_info() if running else (manager._read_state("service") or {})
+            uptime, restarts = "-", "-"
+            if running:
+                try:
+                    uptime = self._format_uptime(now - psutil.Process(pid).create_time())
+                except (psutil.NoSuchProcess, psutil.AccessDenied):
+                    pass
+                supervisor = manager._read_state("supervisor") or {}
+                if supervisor.get("pid") == pid:
+                    restarts = supervisor.get("restarts", 0)
+            print(f"{manager.label:<16}{'running' if running else 'stopped':<9}{pid or '-':>8}{info.get('port', '-'):>7}"
+                  f"{info.get('workers', '-'):>9}  {info.get('profile', '-'):<12}{uptime:<14}{restarts:>8}")
+
     def status(self):
-        """查看服务状态"""
-        if self.is_running():
+        """查看服务状态，存在命名实例且未指定实例时以表格列出所有实例"""
+        if self.name is None and len(self.instance_names()) > 1:
+            self._print_instance_table()
+        elif self.is_running():
             pid = self.get_pid()
-            print(f"服务运行中 (PID: {pid})")
-            print("访问地址: http://localhost:8000")
+            info = self._service_info()
+            print(f"服务运行中 (PID: {pid}, worker 数: {info.get('workers', '未知')})")
+            profile = info.get("profile")
+            if profile in SERVER_PROFILES:
+                settings = ", ".join(f"{k}={v}" for k, v in SERVER_PROFILES[profile].items() if k != "reload")
+                print(f"启动配置: {profile}{f' ({settings})' if settings else ''}")
+            if info.get("scheduling"):
+                print(f"调度设置: {self._format_scheduling(info['scheduling'])}")
+            supervisor = self._read_state("supervisor") or {}
+            if supervisor.get("pid") == pid:
+                print(f"守护模式: 服务进程 PID {supervisor.get('server_pid')}, 已重启 {supervisor.get('restarts', 0)} 次")
+                for event in self._read_supervisor_events(3):
+                    detail = {k: v for k, v in event.items() if k not in ("ts", "event")}
+                    print(f"  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(event['ts']))} {event['event']} {detail}")
+            self._print_processes(pid, scheduling=bool(info.get("scheduling")))
+            if info.get("port"):
+                print(f"访问地址: http://localhost:{info['port']}")
         else:
-            print("服务未运行")
+            print(f"服务未运行{f' (实例: {self.name})' if self.name else ''}")
         
-        # 检查前端构建状态
-        backend_static = self.backend_dir / "static"
-        if backend_static.exists():
-            print("前端已构建")
+        # 检查前端构建状态（基于构建清单比对构建输入哈希）
+        build_state = self.frontend_build_state()
+        if build_state == "current":
+            print("前端已构建（最新）")
+        elif build_state == "stale":
+            print("前端已构建，但源码已变化，需要重新构建: python leek.py build")
         else:
             print("前端未构建")
 
+    @staticmethod
+    def log_segments(log_file: Path) -> list:
+        """返回 [(分段文件, 索引文件)]，按时间从旧到新排列，最后一个为当前日志"""
+        segments = []
+        for path in log_file.parent.glob(f"{log_file.name}.*"):
+            if path.suffix in (".idx", ".tmp"):
+                continue
+            if path.suffix == ".gz" and path.with_suffix("").exists():
+                continue  # 正在压缩，仍读取原始分段
+            raw_name = path.name[:-3] if path.suffix == ".gz" else path.name
+            segments.append((path, path.with_name(raw_name + ".idx")))
+        # 同一秒内多次轮转时 `<时间>-1` 按名称会排在 `<时间>` 之前，按分段中第一条记录的写入时间排序
+        segments.sort(key=LeekManager._segment_started_at)
+        if log_file.exists():
+            segments.append((log_file, log_file.with_name(log_file.name + ".idx")))
+        return segments
+
+    @staticmethod
+    def _segment_started_at(item: tuple) -> tuple:
+        """分段的排序键：索引第一条记录的时间，索引缺失时用文件修改时间"""
+        segment, index_path = item
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                return float(f.readline().split()[0]), segment.name
+        except (OSError, ValueError, IndexError):
+            pass
+        try:
+            return segment.stat().st_mtime, segment.name
+        except OSError:
+            return 0.0, segment.name
+
+    @staticmethod
+    def _read_log_segment(segment: Path, index_path: Path, since: Optional[float], until: Optional[float]):
+        """借助索引定位 [since, until] 对应的字节范围并逐行产出"""
+        import gzip
+        entries = []
+        try:
+            for line in index_path.read_text(encoding="utf-8").splitlines():
+                parts = line.split()
+                if len(parts) >= 2:
+                    entries.append((float(parts[0]), int(parts[1]), int(parts[2]) if len(parts) > 2 else None))
+        except (OSError, ValueError):
+            entries = []
+        compressed = segment.suffix == ".gz"
+
+        start = (0.0, 0, 0)
+        end_offset = None
+        for entry in entries:
+            if since is not None and entry[0] <= since:
+                start = entry
+            if until is not None and entry[0] > until:
+                end_offset = entry[1]
+                break
+        if compressed and start[2] is None:
+            start = (0.0, 0, 0)
+
+        with open(segment, "rb") as f:
+            if compressed:
+                f.seek(start[2])
+                stream = gzip.GzipFile(fileobj=f)
+            else:
+                f.seek(start[1])
+                stream = f
+            position = start[1]
+            for line in stream:
+                if end_offset is not None and position >= end_offset:
+                    break
+                position += len(line)
+                yield line.decode("utf-8", errors="replace").rstrip("\r\n")
+
+    @staticmethod
+    def _parse_time(value: str) -> float:
+        """解析时间参数：10m/2h/1d 等相对时间、HH:MM[:SS]（今天）或 ISO 格式日期时间"""
+        import re
+        from datetime import datetime
+        match = re.fullmatch(r"(\d+(?:\.\d+)?)([smhd])", value)
+        if match:
+            return time.time() - float(match.group(1)) * {"s": 1, "m": 60, "h": 3600, "d": 86400}[match.group(2)]
+        if re.fullmatch(r"\d{1,2}:\d{2}(:\d{2})?", value):
+            value = f"{datetime.now():%Y-%m-%d} {value}"
+        try:
+            return datetime.fromisoformat(value).timestamp()
+        except ValueError:
+            raise SystemExit(f"无法解析时间: {value}（示例: 30m, 2h, 14:30, 2025-01-01 14:30:00）")
+
+    def logs(self, since: Optional[str] = None, until: Optional[str] = None, grep: Optional[str] = None,
+             lines: Optional[int] = None):
+        """查询服务日志（含已轮转的分段），按索引定位时间范围"""
+        import re
+        from collections import deque
+        since_ts = self._parse_time(since) if since else None
+        until_ts = self._parse_time(until) if until else None
+        pattern = re.compile(grep) if grep else None
+
+        if since_ts is None and until_ts is None and pattern is None:
+            # 无过滤条件时只需读取当前日志末尾
+            for line in self._tail(self.log_file, lines or 50):
+                print(line)
+            return True
+
+        segments = self.log_segments(self.log_file)
+        output = deque(maxlen=lines) if lines else None
+        for i, (segment, index_path) in enumerate(segments):
+            try:
+                mtime = segment.stat().st_mtime
+            except OSError:
+                continue
+            if since_ts is not None and mtime < since_ts:
+                continue  # 分段最后写入时间早于 since，整段跳过
+            if until_ts is not None and i > 0:
+                # 上一分段的最后写入时间即本分段开始时间的上界
+                try:
+                    if segments[i - 1][0].stat().st_mtime > until_ts:
+                        break
+                except OSError:
+                    pass
+            for line in self._read_log_segment(segment, index_path, since_ts, until_ts):
+                if pattern is not None and not pattern.search(line):
+                    continue
+                if output is not None:
+                    output.append(line)
+                else:
+                    print(line)
+        for line in output or ():
+            print(line)
+        return True
+
+    # monitor 输出的 Prometheus 指标：(字段, 指标名, 类型, 说明)
+    MONITOR_METRICS = (
+        ("cpu_percent", "leek_process_cpu_percent", "gauge", "CPU usage percent"),
+        ("rss", "leek_process_rss_bytes", "gauge", "Resident set size"),
+        ("uss", "leek_process_uss_bytes", "gauge", "Unique set size"),
+        ("threads", "leek_process_threads", "gauge", "Number of threads"),
+        ("fds", "leek_process_open_fds", "gauge", "Number of open file descriptors"),
+        ("connections", "leek_process_connections", "gauge", "Number of inet sockets"),
+        ("read_bytes", "leek_process_io_read_bytes_total", "counter", "Bytes read"),
+        ("write_bytes", "leek_process_io_write_bytes_total", "counter", "Bytes written"),
+    )
+
+    @staticmethod
+    def _sample_process(process, role: str) -> dict:
+        """采集单个进程的资源占用，不支持或无权限的指标记为 None"""
+        sample = {"pid": process.pid, "role": role}
+        with process.oneshot():
+            sample["cpu_percent"] = process.cpu_percent(None)
+            try:
+                memory = process.memory_full_info()
+                sample["rss"], sample["uss"] = memory.rss, getattr(memory, "uss", None)
+            except psutil.AccessDenied:
+                sample["rss"], sample["uss"] = process.memory_info().rss, None
+            sample["threads"] = process.num_threads()
+            try:
+                sample["fds"] = process.num_fds() if hasattr(process, "num_fds") else process.num_handles()
+            except psutil.AccessDenied:
+                sample["fds"] = None
+            try:
+                connections = process.net_connections(kind="inet") if hasattr(process, "net_connections") else process.connections(kind="inet")
+                sample["connections"] = len(connections)
+            except psutil.AccessDenied:
+                sample["connections"] = None
+            try:
+                io = process.io_counters()
+                sample["read_bytes"], sample["write_bytes"] = io.read_bytes, io.write_bytes
+            except (psutil.AccessDenied, AttributeError):
+                sample["read_bytes"], sample["write_bytes"] = None, None
+        return sample
+
+    def _write_prometheus(self, path: Path, samples: list):
+        """以 node_exporter textfile 格式原子写入指标"""
+        lines = []
+        # 命名实例的指标带 leek_instance 标签，多个实例可写入同一目录
+        instance = f'leek_instance="{self.name}",' if self.name else ""
+        for key, metric, metric_type, help_text in self.MONITOR_METRICS:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {metric_type}")
+            for sample in samples:
+                if sample[key] is not None:
+                    lines.append(f'{metric}{{{instance}pid="{sample["pid"]}",role="{sample["role"]}"}} {sample[key]}')
+        lines.append("# HELP leek_process_count Number of processes in the service tree")
+        lines.append("# TYPE leek_process_count gauge")
+        lines.append(f"leek_process_count{{{instance.rstrip(',')}}} {len(samples)}" if instance
+                     else f"leek_process_count {len(samples)}")
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        os.replace(tmp, path)
+
+    def monitor(self, interval: float = 2.0, count: Optional[int] = None,
+                prom_file: Optional[Path] = None, jsonl_file: Optional[Path] = None):
+        """按间隔采样服务进程树的资源占用，可输出为 Prometheus 文本文件或 JSONL"""
+        if not self.is_running():
+            print("服务未运行")
+            return False
+        pid = self.get_pid()
+        processes = {}
+        print(f"监控服务进程树 (PID: {pid})，采样间隔 {interval}s，Ctrl+C 退出")
+
+        def fmt_bytes(value):
+            return "-" if value is None else f"{value / 1024 / 1024:.1f}M"
+
+        def fmt(value):
+            return "-" if value is None else str(value)
+
+        samples_taken = 0
+        try:
+            while count is None or samples_taken < count:
+                try:
+                    master = psutil.Process(pid)
+                    tree = [(master, self._process_role(master, top=True))] + [
+                        (child, self._process_role(child)) for child in master.children(recursive=True)]
+                except psutil.NoSuchProcess:
+                    print("服务进程已退出")
+                    return False
+                # 复用 Process 对象，cpu_percent 才能基于上一次采样计算
+                current = {}
+                for process, role in tree:
+                    process = processes.get(process.pid, process)
+                    if process.pid not in processes:
+                        process.cpu_percent(None)
+                    current[process.pid] = (process, role)
+                processes = {p: proc for p, (proc, _) in current.items()}
+                time.sleep(interval)
+
+                samples = []
+                for process, role in current.values():
+                    try:
+                        samples.append(self._sample_process(process, role))
+                    except psutil.NoSuchProcess:
+                        continue
+                samples_taken += 1
+                now = time.time()
+
+                print(f"\n{time.strftime('%H:%M:%S', time.localtime(now))}")
+                print(f"  {'role':<11}{'PID':>8}{'CPU%':>8}{'RSS':>10}{'USS':>10}{'THR':>6}{'FDS':>6}{'SOCK':>6}{'READ':>10}{'WRITE':>10}")
+                for sample in samples:
+                    print(f"  {sample['role']:<11}{sample['pid']:>8}{sample['cpu_percent']:>8.1f}"
+                          f"{fmt_bytes(sample['rss']):>10}{fmt_bytes(sample['uss']):>10}{fmt(sample['threads']):>6}"
+                          f"{fmt(sample['fds']):>6}{fmt(sample['connections']):>6}"
+                          f"{fmt_bytes(sample['read_bytes']):>10}{fmt_bytes(sample['write_bytes']):>10}")
+                print(f"  {'total':<11}{len(samples):>8}{sum(s['cpu_percent'] for s in samples):>8.1f}"
+                      f"{fmt_bytes(sum(s['rss'] for s in samples)):>10}"
+                      f"{fmt_bytes(sum(s['uss'] or 0 for s in samples)):>10}{sum(s['threads'] for s in samples):>6}")
+
+                if prom_file:
+                    self._write_prometheus(prom_file, samples)
+                if jsonl_file:
+                    with open(jsonl_file, "a", encoding="utf-8") as f:
+                        f.write(json.dumps({"ts": now, "pid": pid, "processes": samples}, ensure_ascii=False) + "\n")
+        except KeyboardInterrupt:
+            pass
+        return True
+
+    @staticmethod
+    def _parse_importtime(stderr: str) -> list:
+        """
+        解析 -X importtime 输出为模块树。输出按后序排列（子模块先于父模块），
+        缩进表示层级，遇到父模块时把之前更深一层的节点收为子节点。
+        """
+        pending = []
+        for line in stderr.splitlines():
+            if not line.startswith("import time:"):
+                continue
+            parts = line[len("import time:"):].split("|")
+            if len(parts) != 3 or not parts[0].strip().isdigit():
+                continue  # 表头
+            name = parts[2].rstrip()
+            depth = (len(name) - len(name.lstrip())) // 2
+            node = {"name": name.strip(), "self_us": int(parts[0]), "cumulative_us": int(parts[1]), "children": []}
+            while pending and pending[-1][0] > depth:
+                node["children"].insert(0, pending.pop()[1])
+            pending.append((depth, node))
+        return [node for _, node in pending]
+
+    def profile_startup(self, output: Optional[Path] = None, compare: Optional[Path] = None, top: int = 15) -> bool:
+        """
+        在虚拟环境中以 -X importtime 导入 app.main:app，按顶层包汇总导入耗时并列出最重的导入链，
+        结果保存为 JSON（默认 .leek/startup-profile.json），compare 指定上一次的结果时打印各包耗时变化
+        """
+        print("分析后端启动导入耗时...")
+        if not self.venv_python():
+            print("虚拟环境不存在，请先执行 install")
+            return False
+        cmd = self._venv_command("-X", "importtime", "-c", "from app.main import app")
+        start_time = time.perf_counter()
+        result = subprocess.run(cmd, cwd=self.backend_dir, capture_output=True, text=True)
+        wall = time.perf_counter() - start_time
+        roots = self._parse_importtime(result.stderr)
+        if result.returncode != 0:
+            errors = [line for line in result.stderr.splitlines() if not line.startswith("import time:")]
+            print("导入 app.main 失败:")
+            for line in errors[-20:]:
+                print(f"  {line}")
+            return False
+
+        # 顶层包：self 为包内所有模块自身耗时之和，cumulative 为从包外首次进入该包时的累计耗时（含其触发的依赖）
+        packages, modules = {}, {}
+        stack = [(node, None) for node in roots]
+        while stack:
+            node, parent_package = stack.pop()
+            package = node["name"].split(".")[0]
+            modules[node["name"]] = {"self_us": node["self_us"], "cumulative_us": node["cumulative_us"]}
+            stat = packages.setdefault(package, {"self_us": 0, "cumulative_us": 0, "modules": 0})
+            stat["self_us"] += node["self_us"]
+            stat["modules"] += 1
+            if package != parent_package:
+                stat["cumulative_us"] += node["cumulative_us"]
+            stack.extend((child, package) for child in node["children"])
+
+        chains = []
+        for root in sorted(roots, key=lambda node: -node["cumulative_us"])[:top]:
+            chain, node = [], root
+            while node:
+                chain.append({"name": node["name"], "cumulative_us": node["cumulative_us"]})
+                node = max(node["children"], key=lambda child: child["cumulative_us"], default=None)
+            chains.append(chain)
+
+        total_us = sum(node["cumulative_us"] for node in roots)
+        stdlib = getattr(sys, "stdlib_module_names", ())
+        print(f"导入 {len(modules)} 个模块，导入耗时 {total_us / 1000:.1f}ms，进程总耗时 {wall * 1000:.0f}ms")
+        print(f"{'包':<24}{'累计':>12}{'自身':>12}{'模块数':>8}")
+        for package, stat in sorted(packages.items(), key=lambda item: -item[1]["cumulative_us"])[:top]:
+            label = package + (" (标准库)" if package in stdlib else "")
+            print(f"{label:<24}{stat['cumulative_us'] / 1000:>10.1f}ms{stat['self_us'] / 1000:>10.1f}ms{stat['modules']:>8}")
+        print("最重的导入链:")
+        for chain in chains[:5]:
+            print("  " + " -> ".join(f"{item['name']}({item['cumulative_us'] / 1000:.1f}ms)" for item in chain[:8]))
+
+        profile = {
+            "created_at": time.time(),
+            "python": self.venv_python(),
+            "wall_s": wall,
+            "total_us": total_us,
+            "packages": packages,
+            "modules": modules,
+            "chains": chains,
+        }
+        output = Path(output) if output else self.state_dir / "startup-profile.json"
+        output.parent.mkdir(parents=True, exist_ok=True)
+        tmp = output.with_name(output.name + ".tmp")
+        tmp.write_text(json.dumps(profile, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp, output)
+        print(f"结果已保存: {output}")
+
+        if compare:
+            try:
+                baseline = json.loads(Path(compare).read_text(encoding="utf-8"))
+            except (OSError, ValueError) as e:
+                print(f"读取对比文件失败: {e}")
+                return False
+            old_packages = baseline.get("packages", {})
+            deltas = []
+            for package in set(packages) | set(old_packages):
+                old = old_packages.get(package, {}).get("cumulative_us", 0)
+                new = packages.get(package, {}).get("cumulative_us", 0)
+                deltas.append((new - old, package, old, new))
+            print(f"与 {compare} 对比: 导入耗时 {baseline.get('total_us', 0) / 1000:.1f}ms -> {total_us / 1000:.1f}ms "
+                  f"({(total_us - baseline.get('total_us', 0)) / 1000:+.1f}ms)")
+            for delta, package, old, new in sorted(deltas, key=lambda item: -abs(item[0]))[:top]:
+                if delta:
+                    print(f"  {package:<24}{old / 1000:>10.1f}ms -> {new / 1000:>8.1f}ms ({delta / 1000:+.1f}ms)")
+        return True
+
+    def run_alembic(self, *operations: str, timing: bool = False) -> "CommandResult":
+        """在项目虚拟环境中一次启动依次执行多个 alembic 操作（见 _alembic）"""
+        args = self._venv_command(str(Path(__file__).absolute()), "_alembic", *operations)
+        if timing:
+            args.append("--timing")
+        return self.run_command(shell_join(args), cwd=self.backend_dir)
+
     def dml(self, message: str = None):
         """生成数据库迁移脚本"""
         print("生成数据库迁移脚本...")
@@ -514,32 +3056,21 @@ class LeekManager:
         if not self.ensure_alembic_dirs():
             return False
         
-        # 构建alembic命令
-        cmd = f"{sys.executable} -m poetry run alembic revision --autogenerate"
-        if message:
-            cmd += f' -m "{message}"'
-        
-        print(f"执行迁移命令: {cmd}")
-        
-        # 执行alembic命令
-        if self.run_command(cmd, cwd=self.backend_dir):
+        if self.run_alembic(f"revision={message}" if message else "revision"):
             print("迁移脚本生成成功!")
             return True
         else:
             print("迁移脚本生成失败!")
             return False
 
-    def migrate(self):
-        """应用数据库迁移"""
+    def migrate(self, timing: bool = False):
+        """应用数据库迁移，完成后在同一进程中显示当前版本；timing 为 True 时打印每个版本的耗时"""
         print("应用数据库迁移...")
         
         if not self.ensure_alembic_dirs():
             return False
         
-        cmd = f"{sys.executable} -m poetry run alembic upgrade head"
-        print(f"执行迁移命令: {cmd}")
-        
-        if self.run_command(cmd, cwd=self.backend_dir):
+        if self.run_alembic("upgrade=head", "current", timing=timing):
             print("数据库迁移应用成功!")
             return True
         else:
@@ -553,10 +3084,7 @@ class LeekManager:
         if not self.ensure_alembic_dirs():
             return False
         
-        cmd = f"{sys.executable} -m poetry run alembic downgrade {revision}"
-        print(f"执行回滚命令: {cmd}")
-        
-        if self.run_command(cmd, cwd=self.backend_dir):
+        if self.run_alembic(f"downgrade={revision}", "current"):
             print("数据库回滚成功!")
             return True
         else:
@@ -570,10 +3098,7 @@ class LeekManager:
         if not self.ensure_alembic_dirs():
             return False
         
-        cmd = f"{sys.executable} -m poetry run alembic current"
-        print(f"执行状态查询命令: {cmd}")
-        
-        if self.run_command(cmd, cwd=self.backend_dir):
+        if self.run_alembic("current"):
             print("数据库状态查询成功!")
             return True
         else:
@@ -581,22 +3106,13 @@ class LeekManager:
             return False
 
     def check_migration(self):
-        """手动触发迁移检查"""
+        """手动触发迁移检查：重置连接状态（强制重新检查）和执行迁移在同一进程中完成"""
         print("手动触发迁移检查...")
         
         if not self.ensure_alembic_dirs():
             return False
         
-        # 重置迁移检查状态，强制重新检查
-        cmd = f"{sys.executable} -m poetry run python -c \"from app.db.session import reset_connection; reset_connection()\""
-        print("重置连接状态...")
-        self.run_command(cmd, cwd=self.backend_dir)
-        
-        # 执行迁移
-        cmd = f"{sys.executable} -m poetry run alembic upgrade head"
-        print(f"执行迁移命令: {cmd}")
-        
-        if self.run_command(cmd, cwd=self.backend_dir):
+        if self.run_alembic("reset_connection", "upgrade=head"):
             print("迁移检查完成!")
             return True
         else:
@@ -651,7 +3167,118 @@ class LeekManager:
                 print("uvicorn 安装失败，请手动安装: pip install uvicorn")
                 return False
     
-    def install(self):
+    def _venv_key(self) -> dict:
+        """虚拟环境解释器缓存的失效依据：leek-manager 的 pyproject.toml 和 poetry.lock 的修改时间与大小"""
+        key = {}
+        for name in ("pyproject.toml", "poetry.lock"):
+            try:
+                stat = (self.backend_dir / name).stat()
+                key[name] = [stat.st_mtime_ns, stat.st_size]
+            except OSError:
+                key[name] = None
+        return key
+
+    def venv_python(self, refresh: bool = False) -> Optional[str]:
+        """
+        poetry 虚拟环境的解释器路径，解析一次后缓存到 .leek/venv.json，
+        pyproject.toml/poetry.lock 变化或解释器不存在时重新通过 poetry env info 解析；
+        虚拟环境尚未创建时返回 None
+        """
+        if self._venv_python and not refresh:
+            return self._venv_python
+        key = self._venv_key()
+        state = self._read_state("venv")
+        if not refresh and state and state.get("key") == key and Path(state.get("python", "")).exists():
+            self._venv_python = state["python"]
+            return self._venv_python
+        python = None
+        try:
+            result = subprocess.run(
+                [sys.executable, "-m", "poetry", "env", "info", "-p"],
+                cwd=self.backend_dir,
+                capture_output=True,
+                text=True,
+                timeout=30
+            )
+            if result.returncode == 0 and result.stdout.strip():
+                venv = Path(result.stdout.strip())
+                candidate = venv / ("Scripts/python.exe" if os.name == "nt" else "bin/python")
+                if candidate.exists():
+                    python = str(candidate)
+        except (OSError, subprocess.SubprocessError):
+            pass
+        if python:
+            try:
+                self._write_state("venv", {"python": python, "key": key})
+            except OSError as e:
+                print(f"写入虚拟环境缓存失败: {e}")
+        self._venv_python = python
+        return python
+
+    def _venv_command(self, *args: str) -> list:
+        """在 poetry 虚拟环境中运行 python 的命令：直接使用缓存的解释器，无法解析时回退到 poetry run"""
+        python = self.venv_python()
+        if python:
+            return [python, *args]
+        return [sys.executable, "-m", "poetry", "run", "python", *args]
+
+    def _install_fingerprint(self) -> dict:
+        """依赖安装指纹：pyproject/poetry.lock 内容 + 解释器路径与版本"""
+        files = {}
+        for path in (
+            self.core_dir / "pyproject.toml",
+            self.backend_dir / "pyproject.toml",
+            self.core_dir / "poetry.lock",
+            self.backend_dir / "poetry.lock",
+        ):
+            files[path.relative_to(self.project_root).as_posix()] = self._file_digest(path)
+        return {
+            "files": files,
+            "python": sys.executable,
+            "python_version": sys.version,
+        }
+
+    def _install_is_current(self) -> bool:
+        """上次安装成功后依赖与解释器都未变化"""
+        state = self._read_state("install")
+        if not state or state.get("fingerprint") != self._install_fingerprint():
+            return False
+        # 虚拟环境被删除时指纹仍然一致，需要重新安装
+        venv = state.get("venv")
+        return bool(venv) and Path(venv).exists()
+
+    def _save_install_fingerprint(self, online_duration: Optional[float] = None):
+        """
+        安装成功后记录指纹（poetry 可能重写 lock 文件，因此安装后再计算）；
+        online_duration 为在线安装耗时，离线安装时保留上一次的记录用于计算节省的时间
+        """
+        # poetry env use 可能切换了虚拟环境，重新解析解释器
+        python = self.venv_python(refresh=True)
+        venv = str(Path(python).parent.parent) if python else None
+        if online_duration is None:
+            online_duration = (self._read_state("install") or {}).get("online_install_s")
+        try:
+            self._write_state("install", {"fingerprint": self._install_fingerprint(), "venv": venv,
+                                          "online_install_s": online_duration})
+        except OSError as e:
+            print(f"写入安装指纹失败: {e}")
+
+    def install(self, force: bool = False, offline: bool = False):
+        """安装 leek-core 和 leek-manager 依赖，指纹未变化时直接跳过；offline 时只从 vendor 的本地 wheelhouse 安装"""
+        check_start = time.perf_counter()
+        if not force and self._install_is_current():
+            print(f"依赖未变化，跳过安装（检查耗时 {(time.perf_counter() - check_start) * 1000:.1f}ms）")
+            return True
+        if force:
+            print("强制重新安装依赖")
+        else:
+            print(f"依赖已变化或未安装（检查耗时 {(time.perf_counter() - check_start) * 1000:.1f}ms）")
+        if offline:
+            return self._install_offline()
+        install_start = time.perf_counter()
+
+        import tomllib
+        import importlib.metadata
         with open(self.core_dir / "pyproject.toml", "rb") as f:
             local_config = tomllib.load(f)
         # 优先读取 PEP 621 的 [project].version，如不存在则回退到 Poetry 的 [tool.poetry].version
@@ -664,7 +3291,7 @@ class LeekManager:
         installed_version = None
         try:
             result = subprocess.run(
-                [sys.executable, "-m", "poetry", "run", "python", "-c", "import importlib.metadata; print(importlib.metadata.version('leek-core'))"],
+                self._venv_command("-c", "import importlib.metadata; print(importlib.metadata.version('leek-core'))"),
                 cwd=self.backend_dir,
                 capture_output=True,
                 text=True,
@@ -679,7 +3306,7 @@ class LeekManager:
         if installed_version is None:
             try:
                 result = subprocess.run(
-                    [sys.executable, "-m", "poetry", "run", "python", "-c", "import leek_core; print('installed')"],
+                    self._venv_command("-c", "import leek_core; print('installed')"),
                     cwd=self.backend_dir,
                     capture_output=True,
                     text=True,
@@ -700,8 +3327,8 @@ class LeekManager:
         # 如果仍然检测不到版本，或者版本不匹配，则重新安装
         if installed_version is None or installed_version != expected_version:
             print(f"更新leek-core:{installed_version or '未安装'} -> {expected_version}")
-            # 本地路径依赖，使用 poetry run pip install 确保在虚拟环境中安装
-            if not self.run_command(f"{sys.executable} -m poetry run pip install -e {self.core_dir}", cwd=self.backend_dir):
+            # 本地路径依赖，使用虚拟环境的解释器执行 pip install 确保在虚拟环境中安装
+            if not self.run_command(shell_join(self._venv_command("-m", "pip", "install", "-e", str(self.core_dir))), cwd=self.backend_dir):
                 print("leek-core 本地安装失败！")
                 return False
             print("leek-core 安装完成！")
@@ -711,11 +3338,321 @@ class LeekManager:
             print(f"leek-manager 依赖安装失败, 请检查!")
             return False
         print("leek-manager 依赖安装完成！")
+        self._save_install_fingerprint(online_duration=time.perf_counter() - install_start)
+        # 依赖已更新，预编译项目和 site-packages，预编译失败不影响安装结果
+        self.compile()
         return True
 
-    def run(self, port=8009):
-        """前台运行 leek-manager 服务（适合开发/调试）"""
-        print(f"前台运行 leek-manager 服务，端口: {port} ...")
+    @staticmethod
+    def _normalize_dist_name(name: str) -> str:
+        """PEP 503 规范化包名（wheel 文件名中用 _ 代替 -）"""
+        import re
+        return re.sub(r"[-_.]+", "-", name).lower()
+
+    def _wheelhouse_hits(self, requirements: list) -> tuple:
+        """统计 requirements（name==version）中能在 wheelhouse 找到安装文件的数量，返回 (命中数, 总数, 缺失列表)"""
+        available = set()
+        for path in self.vendor_dir.joinpath("wheels").glob("*"):
+            stem = path.name
+            for suffix in (".whl", ".tar.gz", ".zip"):
+                if stem.endswith(suffix):
+                    stem = stem[:-len(suffix)]
+                    break
+            else:
+                continue
+            parts = stem.split("-") if path.suffix == ".whl" else stem.rsplit("-", 1)
+            if len(parts) >= 2:
+                available.add((self._normalize_dist_name(parts[0]), parts[1]))
+        missing = []
+        for line in requirements:
+            name, _, version = line.partition("==")
+            if (self._normalize_dist_name(name), version.strip()) not in available:
+                missing.append(line)
+        return len(requirements) - len(missing), len(requirements), missing
+
+    @staticmethod
+    def _report_time_saved(label: str, online: Optional[float], offline: float):
+        """打印离线安装相对上一次在线安装节省的时间"""
+        if online:
+            print(f"{label}: 离线耗时 {offline:.1f}s，上次在线耗时 {online:.1f}s，节省 {online - offline:.1f}s")
+        else:
+            print(f"{label}: 离线耗时 {offline:.1f}s（没有在线安装耗时记录，无法计算节省的时间）")
+
+    def _restore_vendored_locks(self):
+        """clean 删除了 poetry.lock 时从 vendor 目录恢复，保证离线安装的依赖版本与 vendor 时一致"""
+        for project in (self.core_dir, self.backend_dir):
+            lock = project / "poetry.lock"
+            saved = self.vendor_dir / "python" / f"{project.name}.poetry.lock"
+            if not lock.exists() and saved.exists():
+                shutil.copy2(saved, lock)
+                print(f"从 vendor 恢复: {lock}")
+
+    def _install_offline(self) -> bool:
+        """只从本地 wheelhouse 安装（pip --no-index），不访问网络也不经过 poetry 的依赖解析"""
+        install_start = time.perf_counter()
+        requirements_file = self.vendor_dir / "python" / "requirements.txt"
+        if not requirements_file.exists():
+            print("离线安装失败: 没有 vendor 的依赖，请先在联网环境执行 python leek.py vendor")
+            return False
+        self._restore_vendored_locks()
+        requirements = [line.strip() for line in requirements_file.read_text(encoding="utf-8").splitlines()
+                        if line.strip() and not line.startswith("#")]
+        hits, total, missing = self._wheelhouse_hits(requirements)
+        print(f"wheelhouse 命中率: {hits}/{total} ({hits / total if total else 1:.0%})")
+        if missing:
+            print(f"wheelhouse 缺少: {', '.join(missing[:10])}" + (" ..." if len(missing) > 10 else ""))
+            print("离线安装失败: 请在联网环境重新执行 python leek.py vendor")
+            return False
+
+        if not self.venv_python():
+            # poetry 创建虚拟环境不需要联网
+            if not self.run_command(shell_join([sys.executable, "-m", "poetry", "env", "use", sys.executable]),
+                                    cwd=self.backend_dir) \
+                    or not self.venv_python(refresh=True):
+                print("创建虚拟环境失败")
+                return False
+        wheels = self.vendor_dir / "wheels"
+        pip = self._venv_command("-m", "pip", "install", "--no-index", "--find-links", str(wheels))
+        if not self.run_command(shell_join(pip + ["-r", str(requirements_file)]), cwd=self.backend_dir):
+            print("leek-manager 依赖离线安装失败!")
+            return False
+        # leek-core 以开发模式安装，构建后端（poetry-core 等）同样来自 wheelhouse
+        if not self.run_command(shell_join(pip + ["--no-deps", "-e", str(self.core_dir)]), cwd=self.backend_dir):
+            print("leek-core 离线安装失败！")
+            return False
+        print("依赖离线安装完成！")
+        self._save_install_fingerprint()
+        self._report_time_saved("依赖安装", (self._read_state("install") or {}).get("online_install_s"),
+                                time.perf_counter() - install_start)
+        self.compile()
+        return True
+
+    @staticmethod
+    def _npm_cache_keys(cache_dir: Path) -> set:
+        """读取 npm 缓存（cacache）index-v5 中记录的请求 key"""
+        keys = set()
+        index_dir = cache_dir / "_cacache" / "index-v5"
+        for root, _, names in os.walk(index_dir):
+            for name in names:
+                try:
+                    with open(os.path.join(root, name), encoding="utf-8") as f:
+                        for line in f:
+                            _, _, entry = line.rstrip("\n").partition("\t")
+                            if entry:
+                                keys.add(json.loads(entry).get("key", ""))
+                except (OSError, ValueError):
+                    continue
+        return keys
+
+    def _npm_cache_hits(self, lock_file: Path, cache_dir: Path) -> tuple:
+        """统计 package-lock.json 中的远程包在 npm 缓存中的命中数，返回 (命中数, 总数)"""
+        lock = json.loads(lock_file.read_text(encoding="utf-8"))
+        resolved = {info["resolved"] for path, info in lock.get("packages", {}).items()
+                    if path and isinstance(info, dict) and str(info.get("resolved", "")).startswith("http")}
+        keys = self._npm_cache_keys(cache_dir)
+        hits = sum(1 for url in resolved if f"make-fetch-happen:request-cache:{url}" in keys)
+        return hits, len(resolved)
+
+    def _npm_install_offline(self) -> bool:
+        """只从 vendor 的 npm 缓存安装前端依赖（npm ci --offline），缓存按 package-lock.json 的哈希区分"""
+        lock_file = self.frontend_dir / "package-lock.json"
+        npm_root = self.vendor_dir / "npm"
+        if not lock_file.exists():
+            # clean 删除了锁文件：恢复最近一次 vendor 时与当前 package.json 匹配的锁文件
+            package_digest = self._file_digest(self.frontend_dir / "package.json")
+            candidates = sorted((meta for meta in npm_root.glob("*/meta.json")), key=lambda p: p.stat().st_mtime, reverse=True)
+            for meta in candidates:
+                try:
+                    if json.loads(meta.read_text(encoding="utf-8")).get("package_json") == package_digest:
+                        shutil.copy2(meta.parent / "package-lock.json", lock_file)
+                        print(f"从 vendor 恢复: {lock_file}")
+                        break
+                except (OSError, ValueError):
+                    continue
+            else:
+                print("离线安装失败: package-lock.json 不存在且没有匹配当前 package.json 的 vendor 缓存")
+                return False
+        cache_dir = npm_root / self._file_digest(lock_file)[:16]
+        if not cache_dir.is_dir():
+            print("离线安装失败: 当前 package-lock.json 没有对应的 npm 缓存，请先在联网环境执行 python leek.py vendor")
+            return False
+        hits, total = self._npm_cache_hits(lock_file, cache_dir)
+        print(f"npm 缓存命中率: {hits}/{total} ({hits / total if total else 1:.0%})")
+        if not self.run_command(shell_join(["npm", "ci", "--offline", "--no-audit", "--no-fund", "--cache", cache_dir]),
+                                cwd=self.frontend_dir):
+            print("前端依赖离线安装失败")
+            return False
+        return True
+
+    def vendor(self, keep_npm_caches: int = 3) -> bool:
+        """
+        在联网环境中填充离线缓存（.leek/vendor，clean 不会删除）：
+        - python/: 当前虚拟环境依赖的 requirements.txt 和两个 poetry.lock 副本
+        - wheels/: 上述依赖以及 leek-core 构建后端的 wheel
+        - npm/<package-lock.json 哈希>/: npm 缓存和对应的 package-lock.json，保留最近 keep_npm_caches 个
+        """
+        import tomllib
+        vendor_start = time.perf_counter()
+        if not self.install():
+            print("依赖安装失败，无法 vendor")
+            return False
+        python_dir = self.vendor_dir / "python"
+        wheels = self.vendor_dir / "wheels"
+        python_dir.mkdir(parents=True, exist_ok=True)
+        wheels.mkdir(parents=True, exist_ok=True)
+
+        print("导出依赖列表...")
+        result = subprocess.run(self._venv_command("-m", "pip", "freeze", "--exclude-editable"),
+                                cwd=self.backend_dir, capture_output=True, text=True)
+        if result.returncode != 0:
+            print(f"导出依赖失败: {result.stderr.strip()}")
+            return False
+        requirements = [line for line in result.stdout.splitlines() if "==" in line and not line.startswith("#")]
+        requirements_file = python_dir / "requirements.txt"
+        requirements_file.write_text("\n".join(requirements) + "\n", encoding="utf-8")
+        for project in (self.core_dir, self.backend_dir):
+            if (project / "poetry.lock").exists():
+                shutil.copy2(project / "poetry.lock", python_dir / f"{project.name}.poetry.lock")
+
+        hits, total, _ = self._wheelhouse_hits(requirements)
+        print(f"wheelhouse 已有 {hits}/{total} 个依赖，下载并构建其余依赖的 wheel...")
+        if not self.run_command(shell_join(self._venv_command("-m", "pip", "wheel", "-r", str(requirements_file),
+                                                              "-w", str(wheels))), cwd=self.backend_dir, timeout=1800):
+            print("下载依赖失败!")
+            return False
+        with open(self.core_dir / "pyproject.toml", "rb") as f:
+            build_requires = tomllib.load(f).get("build-system", {}).get("requires", [])
+        if build_requires and not self.run_command(
+                shell_join(self._venv_command("-m", "pip", "download", "-d", str(wheels), *build_requires)),
+                cwd=self.backend_dir):
+            print("下载 leek-core 构建依赖失败!")
+            return False
+
+        lock_file = self.frontend_dir / "package-lock.json"
+        if self.frontend_dir.exists():
+            if not lock_file.exists() and not self.run_command("npm install --package-lock-only --no-audit --no-fund",
+                                                               cwd=self.frontend_dir):
+                print("生成 package-lock.json 失败!")
+                return False
+            cache_dir = self.vendor_dir / "npm" / self._file_digest(lock_file)[:16]
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            if not self.run_command(shell_join(["npm", "ci", "--prefer-offline", "--no-audit", "--no-fund",
+                                                "--cache", cache_dir]), cwd=self.frontend_dir, timeout=1800):
+                print("填充 npm 缓存失败!")
+                return False
+            shutil.copy2(lock_file, cache_dir / "package-lock.json")
+            (cache_dir / "meta.json").write_text(json.dumps({
+                "package_json": self._file_digest(self.frontend_dir / "package.json"),
+                "vendored_at": time.time(),
+            }), encoding="utf-8")
+            npm_hits, npm_total = self._npm_cache_hits(lock_file, cache_dir)
+            print(f"npm 缓存: {npm_hits}/{npm_total} 个包")
+            caches = sorted((path for path in (self.vendor_dir / "npm").iterdir() if path.is_dir()),
+                            key=lambda path: path.stat().st_mtime, reverse=True)
+            for old in caches[keep_npm_caches:]:
+                self._remove(old, "过期的 npm 缓存")
+
+        files, size = self._path_usage(self.vendor_dir)
+        print(f"vendor 完成: {self.vendor_dir}，{files} 个文件，{size / 1024 / 1024:.1f}MB，"
+              f"耗时 {time.perf_counter() - vendor_start:.1f}s")
+        return True
+
+    def run_task_graph(self, tasks: dict) -> bool:
+        """
+        并行执行任务图：tasks 为 {名称: (可调用对象, [依赖任务名])}，
+        依赖全部成功后任务才会启动，依赖失败的任务跳过；输出按任务加前缀，结束后打印关键路径耗时。
+        """
+        from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+        for name, (_, deps) in tasks.items():
+            unknown = [dep for dep in deps if dep not in tasks]
+            if unknown:
+                raise ValueError(f"任务 {name} 依赖了不存在的任务: {unknown}")
+
+        width = max(len(name) for name in tasks)
+        output = _PrefixedOutput(sys.stdout)
+        results, timings = {}, {}
+        graph_start = time.perf_counter()
+
+        def execute(name):
+            output.set_prefix(f"[{name:<{width}}] ")
+            started = time.perf_counter()
+            try:
+                ok = bool(tasks[name][0]())
+            except Exception as e:
+                print(f"任务异常: {e}")
+                ok = False
+            finally:
+                output.close()
+            timings[name] = (started - graph_start, time.perf_counter() - graph_start)
+            return ok
+
+        original_stdout = sys.stdout
+        sys.stdout = output
+        try:
+            with ThreadPoolExecutor(max_workers=len(tasks)) as pool:
+                running = {}
+                while len(results) < len(tasks):
+                    for name, (_, deps) in tasks.items():
+                        if name in results or name in running.values():
+                            continue
+                        if any(results.get(dep) is False for dep in deps):
+                            results[name] = None  # 依赖失败，跳过
+                        elif all(results.get(dep) for dep in deps):
+                            running[pool.submit(execute, name)] = name
+                    if not running:
+                        # 剩余任务存在循环依赖，无法调度
+                        for name in tasks:
+                            results.setdefault(name, None)
+                        break
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        results[running.pop(future)] = future.result()
+        finally:
+            sys.stdout = original_stdout
+
+        # 关键路径：沿依赖回溯结束时间最晚的链
+        total = time.perf_counter() - graph_start
+        finished = [name for name in tasks if name in timings]
+        print(f"任务耗时汇总（总耗时 {total:.1f}s，串行合计 {sum(end - begin for begin, end in timings.values()):.1f}s）:")
+        for name in tasks:
+            state = {True: "成功", False: "失败", None: "跳过"}[results[name]]
+            if name in timings:
+                begin, end = timings[name]
+                print(f"  {name:<{width}}  {state}  {begin:6.1f}s -> {end:6.1f}s  ({end - begin:.1f}s)")
+            else:
+                print(f"  {name:<{width}}  {state}")
+        if finished:
+            path = [max(finished, key=lambda n: timings[n][1])]
+            while True:
+                deps = [dep for dep in tasks[path[-1]][1] if dep in timings]
+                if not deps:
+                    break
+                path.append(max(deps, key=lambda n: timings[n][1]))
+            path.reverse()
+            print(f"关键路径: {' -> '.join(f'{n}({timings[n][1] - timings[n][0]:.1f}s)' for n in path)}")
+        return all(results.values())
+
+    def deploy(self, port=8009, workers: Optional[int] = None, profile: Optional[str] = None):
+        """部署：install ∥ build 并行，migrate 在 install 之后，最后启动（已运行则重启）服务"""
+        def start():
+            if self.is_running():
+                return self.restart(port=port, workers=workers, profile=profile)
+            return self.start(port=port, workers=workers, profile=profile)
+
+        ok = self.run_task_graph({
+            "install": (self.install, []),
+            "build": (self.build, []),
+            "migrate": (self.migrate, ["install"]),
+            "start": (start, ["build", "migrate"]),
+        })
+        print("部署完成!" if ok else "部署失败!")
+        return ok
+
+    def run(self, port=8009, profile: Optional[str] = None):
+        """前台运行 leek-manager 服务（适合开发/调试），profile 未指定时读取 ENVIRONMENT，默认 dev"""
+        profile = resolve_profile(profile, default="dev")
+        print(f"前台运行 leek-manager 服务，端口: {port}，配置: {profile} ...")
         # 启动前自动安装依赖
         if not self.install():
             print("依赖安装失败，无法启动服务")
@@ -732,57 +3669,185 @@ class LeekManager:
         # 切换到后端目录并运行 uvicorn
         print(f"切换到目录: {self.backend_dir}")
         os.chdir(self.backend_dir)
-        # 使用 poetry run 来确保在正确的虚拟环境中运行
-        cmd = [sys.executable, "-m", "poetry", "run", "uvicorn", "app.main:app", "--host", "0.0.0.0", "--port", str(port), "--reload"]
+        # 直接使用虚拟环境的解释器运行
+        cmd = self._venv_command("-m", "uvicorn", "app.main:app", "--host", "0.0.0.0", "--port", str(port),
+                                 *_uvicorn_cli_args(profile))
+        if SERVER_PROFILES[profile].get("reload"):
+            # 只监听源码目录，避免 watcher 扫描前端产物、node_modules 和日志
+            reload_dirs = [path for path in (self.backend_dir / "app", self.core_dir) if path.is_dir()]
+            cmd.append("--reload")
+            for path in reload_dirs or [self.backend_dir]:
+                cmd += ["--reload-dir", str(path)]
+            for pattern in RELOAD_EXCLUDES:
+                cmd += ["--reload-exclude", pattern]
         print(f"执行命令: {cmd}")
-        os.execv(sys.executable, cmd)
+        os.execv(cmd[0], cmd)
 
 def _print_help():
     print("用法: python leek.py <command>")
     print("命令:")
-    print("  clean    - 清理所有构建输出")
-    print("  cleanpy  - 清理 core 和 manager 目录的 Python 缓存和构建文件")
-    print("  build    - 构建前端并复制到后端")
-    print("  start    - 启动服务")
-    print("  stop     - 停止服务")
-    print("  restart  - 重启服务")
-    print("  status   - 查看服务状态")
+    print("  clean    - 清理所有构建输出（--dry-run 只统计不删除）")
+    print("  cleanpy  - 清理 core 和 manager 目录的 Python 缓存和构建文件（--dry-run 只统计不删除，--stale 只清理过期字节码）")
+    print("  package  - 生成可复现的发布包和校验清单（--name 版本, --compression auto|zstd|gzip, --level N, --output-dir 目录）")
+    print("  compile  - 并行预编译 leek-core、leek-manager 和虚拟环境依赖的字节码（--workers N）")
+    print("  build    - 构建前端并复制到后端（--force 忽略构建清单强制构建，--offline 只从本地 npm 缓存安装依赖）")
+    print("  start    - 启动服务（--workers N 指定 worker 进程数，--profile dev|prod|lowlatency 选择启动配置，"
+          "--cpu-affinity/--nice/--ionice 调度设置）")
+    print("  stop     - 优雅停止服务，超时后强制终止（--timeout 秒，默认 30；--all 并发停止所有实例）")
+    print("  restart  - 滚动重启服务，新实例就绪后再停止旧实例（--workers N, --profile 配置, --cpu-affinity/--nice/--ionice，"
+          "--all 并发重启所有实例）")
+    print("  status   - 查看服务状态（存在命名实例时以表格列出所有实例）")
+    print("  monitor  - 监控服务进程树资源占用（--interval 秒, --count 次数, --prom 文件, --jsonl 文件）")
+    print("  profile-startup - 分析 app.main 导入耗时，按顶层包汇总并保存 JSON（--output 文件, --compare 上次结果, --top N）")
+    print("  logs     - 查询服务日志（--since/--until 时间范围，--grep 正则过滤，-n 最后N行）")
     print("  dml      - 生成数据库迁移脚本")
-    print("  migrate  - 应用数据库迁移")
+    print("  migrate  - 应用数据库迁移（--timing 打印每个版本的耗时）")
     print("  downgrade - 回滚数据库迁移")
     print("  db_status - 查看数据库迁移状态")
     print("  check_migration - 手动触发迁移检查")
-    print("  install   - 安装leek-manager和leek-core依赖")
-    print("  run       - 前台运行 leek-manager 服务")
+    print("  install   - 安装leek-manager和leek-core依赖（--force 忽略指纹强制安装，--offline 只从本地 wheelhouse 安装）")
+    print("  vendor    - 填充离线安装用的 wheelhouse 和 npm 缓存（.leek/vendor，clean 不会删除）")
+    print("  run       - 前台运行 leek-manager 服务（默认 dev 配置：只监听源码目录的热重载）")
+    print("  deploy    - 并行执行 install/build/migrate 后启动服务（--profile 配置）")
     print("  help      - 显示帮助信息")
+    print("start/stop/restart/status/logs/monitor/deploy 可通过 --name 实例名 管理命名实例（.leek/run/<实例名>/）")
+def _pop_flag(args: list, flag: str) -> bool:
+    """从参数列表中取出布尔开关"""
+    if flag in args:
+        args.remove(flag)
+        return True
+    return False
+
+def _pop_option(args: list, option: str, cast=str, default=None):
+    """从参数列表中取出 `--option value` 形式的选项"""
+    if option not in args:
+        return default
+    index = args.index(option)
+    if index + 1 >= len(args):
+        raise SystemExit(f"选项 {option} 缺少参数值")
+    value = args[index + 1]
+    del args[index:index + 2]
+    try:
+        return cast(value)
+    except ValueError:
+        raise SystemExit(f"选项 {option} 的参数值无效: {value}")
+
+def _pop_log_options(args: list) -> dict:
+    """取出日志轮转相关选项，转换为 _logwriter 的参数"""
+    options = {}
+    max_mb = _pop_option(args, "--log-max-mb", float)
+    if max_mb is not None:
+        options["max_bytes"] = int(max_mb * 1024 * 1024)
+    rotate_hours = _pop_option(args, "--log-rotate-hours", float)
+    if rotate_hours is not None:
+        options["interval"] = rotate_hours * 3600
+    backups = _pop_option(args, "--log-backups", int)
+    if backups is not None:
+        options["backups"] = backups
+    return options
+
+def _pop_supervise_options(args: list) -> dict:
+    """取出守护进程相关选项"""
+    options = {}
+    for option, key, cast in (
+        ("--max-restarts", "max_restarts", int),
+        ("--restart-window", "restart_window", float),
+        ("--max-rss-mb", "max_rss_mb", float),
+        ("--max-cpu", "max_cpu", float),
+        ("--watchdog-interval", "watchdog_interval", float),
+        ("--watchdog-samples", "watchdog_samples", int),
+    ):
+        value = _pop_option(args, option, cast)
+        if value is not None:
+            options[key] = value
+    return options
+
+def _instance_name(text: str) -> str:
+    """校验实例名：字母或数字开头，只含字母、数字、`_`、`-`、`.`；default 保留给默认实例"""
+    import re
+    if text == "default" or not re.fullmatch(r"[A-Za-z0-9][A-Za-z0-9_.-]*", text):
+        raise ValueError(text)
+    return text
+
+def _pop_scheduling_options(args: list) -> dict:
+    """取出服务进程树的调度选项（CPU 亲和性、nice、ionice）"""
+    options = {}
+    for option, key, cast in (
+        ("--cpu-affinity", "cpu_affinity", parse_cpu_list),
+        ("--nice", "nice", int),
+        ("--ionice", "ionice", parse_ionice),
+    ):
+        value = _pop_option(args, option, cast)
+        if value is not None:
+            options[key] = value
+    return options
+
 def main():
     if len(sys.argv) < 2:
         _print_help()
         return
     
-    manager = LeekManager()
     command = sys.argv[1].lower()
+    name = _pop_option(sys.argv, "--name", _instance_name) if command in INSTANCE_COMMANDS else None
+    manager = LeekManager(name)
+    require_modules(*COMMAND_DEPENDENCIES.get(command, ()))
     
     if command == "clean":
-        manager.clean()
+        manager.clean(dry_run=_pop_flag(sys.argv, "--dry-run"))
     elif command == "cleanpy":
-        manager.cleanpy()
+        manager.cleanpy(dry_run=_pop_flag(sys.argv, "--dry-run"), stale_only=_pop_flag(sys.argv, "--stale"))
+    elif command == "package":
+        name = _pop_option(sys.argv, "--name")
+        compression = _pop_option(sys.argv, "--compression", str, "auto")
+        level = _pop_option(sys.argv, "--level", int)
+        output_dir = _pop_option(sys.argv, "--output-dir", Path)
+        if not manager.package(name=name, compression=compression, level=level, output_dir=output_dir):
+            sys.exit(1)
+    elif command == "compile":
+        manager.compile(workers=_pop_option(sys.argv, "--workers", int, 0))
     elif command == "build":
-        manager.build()
+        manager.build(force=_pop_flag(sys.argv, "--force"), offline=_pop_flag(sys.argv, "--offline"))
     elif command == "start":
+        workers = _pop_option(sys.argv, "--workers", int)
+        timeout = _pop_option(sys.argv, "--timeout", float, 60)
+        health_path = _pop_option(sys.argv, "--health-path", str, "/")
+        log_options = _pop_log_options(sys.argv)
+        supervise = _pop_flag(sys.argv, "--supervise")
+        supervise_options = _pop_supervise_options(sys.argv)
+        profile = _pop_option(sys.argv, "--profile")
+        scheduling = _pop_scheduling_options(sys.argv)
         if len(sys.argv) < 3:
-            print("用法: python leek.py start <port>")
+            print("用法: python leek.py start <port> [--workers N] [--profile dev|prod|lowlatency] [--timeout 秒] "
+                  "[--health-path /路径] [--cpu-affinity 0-3|0xf] [--nice N] [--ionice rt|be|idle[:0-7]] "
+                  "[--log-max-mb N] [--log-rotate-hours N] [--log-backups N] "
+                  "[--supervise [--max-restarts N] [--restart-window 秒] [--max-rss-mb N] [--max-cpu 百分比]]")
             return
         port = int(sys.argv[2])
-        manager.start(port)
+        manager.start(port, workers=workers, timeout=timeout, health_path=health_path, log_options=log_options,
+                      supervise=supervise, supervise_options=supervise_options, profile=profile, scheduling=scheduling)
     elif command == "stop":
-        manager.stop()
+        timeout = _pop_option(sys.argv, "--timeout", float, 30)
+        if _pop_flag(sys.argv, "--all"):
+            manager.stop_all(timeout=timeout)
+        else:
+            manager.stop(timeout=timeout)
     elif command == "restart":
-        if len(sys.argv) < 3:
-            print("用法: python leek.py restart <port>")
+        workers = _pop_option(sys.argv, "--workers", int)
+        timeout = _pop_option(sys.argv, "--timeout", float, 60)
+        health_path = _pop_option(sys.argv, "--health-path", str, "/")
+        profile = _pop_option(sys.argv, "--profile")
+        scheduling = _pop_scheduling_options(sys.argv)
+        if _pop_flag(sys.argv, "--all"):
+            if len(sys.argv) > 2:
+                print("restart --all 沿用各实例的端口，不能指定端口")
+                return
+            manager.restart_all(timeout=timeout, health_path=health_path, workers=workers, profile=profile,
+                                scheduling=scheduling)
             return
-        port = int(sys.argv[2])
-        manager.restart(port)
+        # 未指定端口时沿用实例记录的端口
+        port = int(sys.argv[2]) if len(sys.argv) > 2 else None
+        manager.restart(port, workers=workers, timeout=timeout, health_path=health_path, profile=profile,
+                        scheduling=scheduling)
     elif command == "status":
         manager.status()
     elif command == "dml":
@@ -792,7 +3857,7 @@ def main():
         message = sys.argv[2]
         manager.dml(message)
     elif command == "migrate":
-        manager.migrate()
+        manager.migrate(timing=_pop_flag(sys.argv, "--timing"))
     elif command == "downgrade":
         if len(sys.argv) < 3:
             print("用法: python leek.py downgrade <revision>")
@@ -804,13 +3869,72 @@ def main():
     elif command == "check_migration":
         manager.check_migration()
     elif command == "install":
-        manager.install()
+        manager.install(force=_pop_flag(sys.argv, "--force"), offline=_pop_flag(sys.argv, "--offline"))
+    elif command == "vendor":
+        if not manager.vendor():
+            sys.exit(1)
+    elif command == "deploy":
+        workers = _pop_option(sys.argv, "--workers", int)
+        profile = _pop_option(sys.argv, "--profile")
+        port = int(sys.argv[2]) if len(sys.argv) > 2 else 8009
+        manager.deploy(port, workers=workers, profile=profile)
     elif command == "run":
+        profile = _pop_option(sys.argv, "--profile")
         if len(sys.argv) < 3:
-            print("用法: python leek.py run <port>")
+            print("用法: python leek.py run <port> [--profile dev|prod|lowlatency]")
             return
         port = int(sys.argv[2])
-        manager.run(port)
+        manager.run(port, profile=profile)
+    elif command == "profile-startup":
+        output = _pop_option(sys.argv, "--output", Path)
+        compare = _pop_option(sys.argv, "--compare", Path)
+        top = _pop_option(sys.argv, "--top", int, 15)
+        manager.profile_startup(output=output, compare=compare, top=top)
+    elif command == "monitor":
+        interval = _pop_option(sys.argv, "--interval", float, 2.0)
+        count = _pop_option(sys.argv, "--count", int)
+        prom_file = _pop_option(sys.argv, "--prom", Path)
+        jsonl_file = _pop_option(sys.argv, "--jsonl", Path)
+        manager.monitor(interval=interval, count=count, prom_file=prom_file, jsonl_file=jsonl_file)
+    elif command == "logs":
+        since = _pop_option(sys.argv, "--since")
+        until = _pop_option(sys.argv, "--until")
+        grep = _pop_option(sys.argv, "--grep")
+        lines = _pop_option(sys.argv, "-n", int)
+        manager.logs(since=since, until=until, grep=grep, lines=lines)
+    elif command == "_serve":
+        # 内部命令：在项目虚拟环境中以继承的 socket 运行 uvicorn
+        workers = _pop_option(sys.argv, "--workers", int, 1)
+        profile = _pop_option(sys.argv, "--profile", str, "prod")
+        _serve(int(sys.argv[2]), workers, profile)
+    elif command == "_compile":
+        # 内部命令：在项目虚拟环境中预编译字节码
+        workers = _pop_option(sys.argv, "--workers", int, 0)
+        site_packages = not _pop_flag(sys.argv, "--no-site-packages")
+        sys.exit(0 if _compile(sys.argv[2:], workers=workers, site_packages=site_packages) else 1)
+    elif command == "_alembic":
+        # 内部命令：在项目虚拟环境中通过 Alembic 命令 API 执行迁移操作
+        timing = _pop_flag(sys.argv, "--timing")
+        _alembic(sys.argv[2:], timing=timing)
+    elif command == "_supervise":
+        # 内部命令：由 start --supervise 启动的守护进程
+        workers = _pop_option(sys.argv, "--workers", int, 1)
+        log_options = {key: value for key, value in (
+            ("max_bytes", _pop_option(sys.argv, "--max-bytes", int)),
+            ("interval", _pop_option(sys.argv, "--interval", float)),
+            ("backups", _pop_option(sys.argv, "--backups", int)),
+        ) if value is not None}
+        supervise_options = _pop_supervise_options(sys.argv)
+        profile = _pop_option(sys.argv, "--profile", str, "prod")
+        manager.supervise(int(sys.argv[2]), workers, log_options=log_options, profile=profile, **supervise_options)
+    elif command == "_logwriter":
+        # 内部命令：由 start 启动，负责写入和轮转服务日志
+        max_bytes = _pop_option(sys.argv, "--max-bytes", int, 100 * 1024 * 1024)
+        interval = _pop_option(sys.argv, "--interval", float, 24 * 3600)
+        backups = _pop_option(sys.argv, "--backups", int, 10)
+        ready_file = _pop_option(sys.argv, "--ready-file", Path)
+        RotatingLogWriter(Path(sys.argv[2]), max_bytes=max_bytes, interval=interval, backups=backups,
+                          ready_file=ready_file).pump(sys.stdin.buffer)
     elif command == "help":
         _print_help()
     else: